@@ -0,0 +1,327 @@
+import argparse
+import json
+import os
+import struct
+import sys
+import threading
+import time
+import wave
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+import chartbin
+from levelindex import folder_signature
+
+
+# --- Config ---
+CACHE_NAME = ".audio.wav"   # decoded song, next to level.json
+CACHE_INFO = ".audio.json"  # which file it was decoded from
+PRELOAD_KEEP = 2            # preloaded charts kept (highlighted + previous)
+
+
+# --- Durations from file headers ---
+# Nothing here decodes audio: WAV reads the fmt/data chunks, OGG the first and
+# last page, MP3 the Xing/Info/VBRI header or, failing that, the frame headers.
+def wav_duration_ms(path):
+    with open(path, "rb") as f:
+        riff, _size, kind = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or kind != b"WAVE":
+            return None
+        byte_rate = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return None
+            chunk, size = struct.unpack("<4sI", header)
+            if chunk == b"fmt ":
+                fmt = f.read(size)
+                byte_rate = struct.unpack_from("<I", fmt, 8)[0]
+                if size % 2:
+                    f.seek(1, 1)
+            elif chunk == b"data":
+                if not byte_rate:
+                    return None
+                if size == 0xFFFFFFFF:   # streamed file, size never filled in
+                    size = os.fstat(f.fileno()).st_size - f.tell()
+                return int(size * 1000 / byte_rate)
+            else:
+                f.seek(size + size % 2, 1)
+
+
+def ogg_duration_ms(path):
+    with open(path, "rb") as f:
+        head = f.read(4096)
+        if head[:4] != b"OggS":
+            return None
+        vorbis = head.find(b"\x01vorbis")
+        opus = head.find(b"OpusHead")
+        if vorbis >= 0:
+            rate = struct.unpack_from("<I", head, vorbis + 12)[0]
+            skip = 0
+        elif opus >= 0:
+            rate = 48000   # opus granules always count 48 kHz samples
+            skip = struct.unpack_from("<H", head, opus + 10)[0]
+        else:
+            return None
+        size = os.fstat(f.fileno()).st_size
+        f.seek(max(0, size - 65536))
+        tail = f.read()
+    # last page with a real granule position
+    at = tail.rfind(b"OggS")
+    while at >= 0:
+        if at + 14 <= len(tail):
+            granule = struct.unpack_from("<q", tail, at + 6)[0]
+            if granule >= 0:
+                return int(max(granule - skip, 0) * 1000 / rate)
+        at = tail.rfind(b"OggS", 0, at)
+    return None
+
+
+# MPEG audio layer III tables, indexed [mpeg1][bitrate index] in kbps
+MP3_BITRATES = {
+    True: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    False: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MP3_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def mp3_frame(data, at):
+    # (frame length, samples per frame, sample rate, mono, mpeg1) or None
+    if at + 4 > len(data) or data[at] != 0xFF or data[at + 1] & 0xE0 != 0xE0:
+        return None
+    version = (data[at + 1] >> 3) & 3
+    layer = (data[at + 1] >> 1) & 3
+    bitrate_index = data[at + 2] >> 4
+    rate_index = (data[at + 2] >> 2) & 3
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    mpeg1 = version == 3
+    bitrate = MP3_BITRATES[mpeg1][bitrate_index] * 1000
+    rate = MP3_RATES[version][rate_index]
+    samples = 1152 if mpeg1 else 576
+    padding = (data[at + 2] >> 1) & 1
+    length = samples // 8 * bitrate // rate + padding
+    mono = (data[at + 3] >> 6) == 3
+    return length, samples, rate, mono, mpeg1
+
+
+def mp3_duration_ms(path):
+    data = Path(path).read_bytes()
+    at = 0
+    if data[:3] == b"ID3":
+        size = 0
+        for b in data[6:10]:
+            size = (size << 7) | (b & 0x7F)
+        at = 10 + size + (10 if data[5] & 0x10 else 0)
+    # first frame whose successor also lines up, so stray 0xFF bytes in
+    # leftover tags are not taken for a frame
+    while at < len(data):
+        frame = mp3_frame(data, at)
+        if frame and mp3_frame(data, at + frame[0]):
+            break
+        at += 1
+    else:
+        return None
+    length, samples, rate, mono, mpeg1 = frame
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    xing = at + 4 + side_info
+    if data[xing:xing + 4] in (b"Xing", b"Info"):
+        flags = struct.unpack_from(">I", data, xing + 4)[0]
+        if flags & 1:
+            return int(struct.unpack_from(">I", data, xing + 8)[0] * samples * 1000 / rate)
+    if data[at + 36:at + 40] == b"VBRI":
+        return int(struct.unpack_from(">I", data, at + 50)[0] * samples * 1000 / rate)
+    # no VBR header: walk the frame headers
+    frames = 0
+    while True:
+        frame = mp3_frame(data, at)
+        if frame is None:
+            break
+        frames += 1
+        at += frame[0]
+    return int(frames * samples * 1000 / rate)
+
+
+DURATION_READERS = {".wav": wav_duration_ms, ".ogg": ogg_duration_ms, ".mp3": mp3_duration_ms}
+
+
+def audio_duration_ms(path):
+    # Song length in ms from the file header, 0 when it cannot be read.
+    reader = DURATION_READERS.get(Path(path).suffix.lower())
+    if reader is None:
+        return 0
+    try:
+        return reader(path) or 0
+    except (OSError, struct.error, IndexError) as e:
+        print("Warning: could not read audio length:", path, e)
+        return 0
+
+
+# --- Decoded audio cache ---
+# MP3/OGG are decoded once into songs/<level>/.audio.wav in the mixer's own
+# format. Opening a WAV is just a header read, so mixer.music.load() no longer
+# stalls on a compressed file. .audio.json records the source's name, size and
+# mtime; the cache is only used while they match exactly, so a replaced song
+# (even an older file) or level.json pointing at another one is decoded again.
+_decode_locks = {}
+_decode_locks_guard = threading.Lock()
+
+
+def cache_path(audio_path):
+    return Path(audio_path).with_name(CACHE_NAME)
+
+
+def source_signature(audio_path):
+    st = Path(audio_path).stat()
+    return {"source": Path(audio_path).name, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def cache_fresh(audio_path):
+    try:
+        info = json.loads(Path(audio_path).with_name(CACHE_INFO).read_text(encoding="utf-8"))
+        return info == source_signature(audio_path) and cache_path(audio_path).exists()
+    except (OSError, ValueError):
+        return False
+
+
+def decode_to_wav(audio_path):
+    # Returns the path to play: the WAV cache, or the original file when it
+    # is already a WAV or the mixer cannot decode it.
+    import pygame
+    audio_path = Path(audio_path)
+    if audio_path.suffix.lower() == ".wav":
+        return audio_path
+    target = cache_path(audio_path)
+    with _decode_locks_guard:
+        lock = _decode_locks.setdefault(target, threading.Lock())
+    with lock:
+        if cache_fresh(audio_path):
+            return target
+        init = pygame.mixer.get_init()
+        if not init or init[1] not in (8, -16):
+            return audio_path
+        rate, size, channels = init
+        try:
+            signature = source_signature(audio_path)
+            raw = pygame.mixer.Sound(str(audio_path)).get_raw()
+            tmp = target.with_name(target.name + ".tmp")
+            with wave.open(str(tmp), "wb") as w:
+                w.setnchannels(channels)
+                w.setsampwidth(abs(size) // 8)
+                w.setframerate(rate)
+                w.writeframes(raw)
+            os.replace(tmp, target)
+            # written last: a cache without matching info is never used
+            info = target.with_name(CACHE_INFO)
+            tmp = info.with_name(info.name + ".tmp")
+            tmp.write_text(json.dumps(signature), encoding="utf-8")
+            os.replace(tmp, info)
+        except (pygame.error, OSError) as e:
+            print("Warning: could not decode audio:", audio_path, e)
+            return audio_path
+        return target
+
+
+class AssetCache:
+    # Gets levels ready to play off the main thread. preload() parses the
+    # highlighted level's chart; decode() writes a played level's audio into
+    # the WAV cache in the background, and with predecode warm() does so for
+    # every level up front (about 10 MB of SD card per minute of audio).
+    # Audio is never held in memory: the mixer streams the WAV cache when it
+    # is ready and the original file until then, so start_level() never
+    # waits for a decode.
+    def __init__(self, keep=PRELOAD_KEEP, predecode=False):
+        self.keep = keep
+        self.predecode = predecode
+        self.loaded = OrderedDict()   # folder -> (signature, Future of a prepared level)
+        self.preloader = ThreadPoolExecutor(1)
+        self.decoder = ThreadPoolExecutor(1)
+
+    def warm(self, levels):
+        if self.predecode:
+            for level in levels:
+                self.decode(level)
+
+    def decode(self, level):
+        path = level.get("meta", {}).get("audio_path")
+        if path and not cache_fresh(path):
+            self.decoder.submit(decode_to_wav, path)
+
+    def preload(self, level):
+        # Called when the menu selection moves; a level edited since it was
+        # preloaded is prepared again. Only the newest preload may wait in the
+        # queue, levels scrolled past are cancelled before they start.
+        folder = level.get("folder")
+        if folder is None:
+            return
+        try:
+            sig = folder_signature(folder)
+        except OSError:
+            sig = None
+        if folder in self.loaded and self.loaded[folder][0] == sig:
+            self.loaded.move_to_end(folder)
+            return
+        for other, (_, future) in list(self.loaded.items()):
+            if future.cancel():
+                del self.loaded[other]
+        self.loaded[folder] = (sig, self.preloader.submit(self._prepare, level))
+        while len(self.loaded) > self.keep:
+            self.loaded.popitem(last=False)[1][1].cancel()
+
+    def get(self, level):
+        # Waits at most for the chart already being parsed; a preload still
+        # queued is dropped and the chart parsed right here.
+        self.preload(level)
+        sig, future = self.loaded[level["folder"]]
+        if future.cancel():
+            future = Future()
+            future.set_result(self._prepare(level))
+            self.loaded[level["folder"]] = (sig, future)
+        return future.result()
+
+    def shutdown(self):
+        self.preloader.shutdown(wait=False, cancel_futures=True)
+        self.decoder.shutdown(wait=False, cancel_futures=True)
+
+    def _prepare(self, level):
+        prepared = {"chart": None, "error": None}
+        try:
+            prepared["chart"] = chartbin.load(level["folder"])
+        except Exception as e:
+            prepared["error"] = e
+        return prepared
+
+
+def load_music(audio_path):
+    # Streams the decoded WAV cache when it is ready, else the song itself.
+    import pygame
+    path = cache_path(audio_path) if cache_fresh(audio_path) else audio_path
+    pygame.mixer.music.load(str(path))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Read song lengths from headers and build the decoded audio cache.")
+    parser.add_argument("paths", nargs="+", help="audio files or song folders")
+    parser.add_argument("--decode", action="store_true", help="also write the .audio.wav cache")
+    args = parser.parse_args(argv)
+    if args.decode:
+        import pygame
+        pygame.mixer.init()
+    for path in map(Path, args.paths):
+        files = [path] if path.is_file() else sorted(p for p in path.rglob("*")
+                                                     if p.suffix.lower() in DURATION_READERS and p.name != CACHE_NAME)
+        for audio in files:
+            t0 = time.perf_counter()
+            length = audio_duration_ms(audio)
+            line = f"{audio}: {length} ms (header read in {(time.perf_counter() - t0) * 1000:.1f} ms)"
+            if args.decode:
+                t0 = time.perf_counter()
+                played = decode_to_wav(audio)
+                line += f", plays from {played.name} (ready in {(time.perf_counter() - t0) * 1000:.0f} ms)"
+            print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
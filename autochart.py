@@ -0,0 +1,265 @@
+import argparse
+import json
+import os
+import sys
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from assets import cache_fresh, cache_path
+from charting import write_chart, LONG_NOTE_THRESHOLD
+from levelindex import find_audio
+
+
+# --- Config ---
+RATE = 22050          # analysis sample rate, audio is decimated down to this
+FRAME = 1024          # STFT frame, 46 ms at RATE
+HOP = 256             # 11.6 ms between frames, the timing resolution
+BLOCK = 4096          # STFT frames per block, bounds memory on long songs
+MIN_GAP_MS = 120      # closest two notes may be, any lanes
+PEAK_MS = 50          # an onset has to be the flux maximum within +-PEAK_MS
+THRESHOLD_MS = 500    # window of the adaptive threshold
+SENSITIVITY = 1.0     # threshold = median + SENSITIVITY * spread, lower = more notes
+BANDS = 24            # log-spaced bands for following a held tone
+SUSTAIN_RATIO = 0.5   # a note holds while its band's energy stays above this share
+MAX_HOLD_MS = 4000    # longest long note
+LANES = 2
+
+
+# --- Decoding ---
+def read_wav(path):
+    with wave.open(str(path), "rb") as w:
+        rate, channels, width = w.getframerate(), w.getnchannels(), w.getsampwidth()
+        raw = w.readframes(w.getnframes())
+    if width == 2:
+        samples = np.frombuffer(raw, "<i2").astype(np.float32) / 32768.0
+    elif width == 1:
+        samples = (np.frombuffer(raw, np.uint8).astype(np.float32) - 128.0) / 128.0
+    else:
+        raise ValueError(f"{path}: unsupported {8 * width}-bit WAV")
+    return samples.reshape(-1, channels).mean(axis=1), rate
+
+
+def decode(audio_path):
+    # Mono float samples and their rate. Uses the game's .audio.wav cache when
+    # it is fresh, otherwise decodes with the mixer (no sound device needed).
+    audio_path = Path(audio_path)
+    if audio_path.suffix.lower() == ".wav":
+        return read_wav(audio_path)
+    if cache_fresh(audio_path):
+        return read_wav(cache_path(audio_path))
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    import pygame
+    if not pygame.mixer.get_init():
+        pygame.mixer.init()
+    rate, size, channels = pygame.mixer.get_init()
+    raw = pygame.mixer.Sound(str(audio_path)).get_raw()
+    dtype = {8: np.uint8, -8: np.int8, 16: "<u2", -16: "<i2", 32: "<f4"}.get(size)
+    if dtype is None:
+        raise ValueError(f"unsupported mixer format {size}")
+    samples = np.frombuffer(raw, dtype).astype(np.float32)
+    if size == 8:
+        samples = (samples - 128.0) / 128.0
+    elif size == 16:
+        samples = (samples - 32768.0) / 32768.0
+    elif size == -16:
+        samples /= 32768.0
+    elif size == -8:
+        samples /= 128.0
+    return samples.reshape(-1, channels).mean(axis=1), rate
+
+
+def resample(samples, rate, target=RATE):
+    # Integer decimation with a box filter; onsets do not need more.
+    step = max(1, int(round(rate / target)))
+    if step == 1:
+        return samples, rate
+    usable = len(samples) // step * step
+    return samples[:usable].reshape(-1, step).mean(axis=1), rate / step
+
+
+# --- Analysis ---
+def spectral_features(samples, rate):
+    # Per STFT frame: spectral flux (summed positive log-magnitude change),
+    # energy in BANDS log-spaced bands, and spectral centroid in Hz.
+    # Computed BLOCK frames at a time.
+    if len(samples) < FRAME:
+        samples = np.pad(samples, (0, FRAME - len(samples)))
+    frames = np.lib.stride_tricks.sliding_window_view(samples, FRAME)[::HOP]
+    window = np.hanning(FRAME).astype(np.float32)
+    freqs = np.fft.rfftfreq(FRAME, 1.0 / rate).astype(np.float32)
+    edges = np.geomspace(40.0, rate / 2, BANDS + 1)
+    band_of = np.clip(np.searchsorted(edges, freqs, side="right") - 1, 0, BANDS - 1)
+    band_matrix = np.zeros((len(freqs), BANDS), np.float32)
+    # mean power per bin, so wide high bands do not win on bin count alone
+    band_matrix[np.arange(len(freqs)), band_of] = 1.0
+    band_matrix /= np.maximum(band_matrix.sum(axis=0), 1.0)
+    count = len(frames)
+    flux = np.zeros(count, np.float32)
+    bands = np.zeros((count, BANDS), np.float32)
+    centroid = np.zeros(count, np.float32)
+    previous = None
+    for start in range(0, count, BLOCK):
+        block = frames[start:start + BLOCK] * window
+        mag = np.abs(np.fft.rfft(block, axis=1)).astype(np.float32)
+        logmag = np.log1p(100.0 * mag)
+        if previous is None:
+            previous = logmag[:1]
+        diff = np.diff(np.vstack([previous, logmag]), axis=0)
+        flux[start:start + len(block)] = np.maximum(diff, 0).sum(axis=1)
+        power = mag * mag
+        total = power.sum(axis=1)
+        bands[start:start + len(block)] = power @ band_matrix
+        centroid[start:start + len(block)] = (power @ freqs) / np.maximum(total, 1e-12)
+        previous = logmag[-1:]
+    return flux, bands, centroid
+
+
+def moving(values, frames, reduce):
+    half = frames // 2
+    padded = np.pad(values, (half, frames - 1 - half), mode="edge")
+    return reduce(np.lib.stride_tricks.sliding_window_view(padded, frames), axis=1)
+
+
+def pick_onsets(flux, frame_ms, sensitivity=SENSITIVITY, min_gap_ms=MIN_GAP_MS):
+    # Local flux maxima above a moving median + spread threshold, then the
+    # strongest first so two onsets closer than min_gap_ms keep the louder one.
+    window = max(3, int(THRESHOLD_MS / frame_ms) | 1)
+    median = moving(flux, window, np.median)
+    spread = moving(np.abs(flux - median), window, np.mean)
+    peak = moving(flux, max(3, int(2 * PEAK_MS / frame_ms) | 1), np.max)
+    candidates = np.flatnonzero((flux >= peak) & (flux > median + sensitivity * spread) & (flux > 0))
+    gap = min_gap_ms / frame_ms
+    taken = np.zeros(len(flux), bool)
+    kept = []
+    for i in candidates[np.argsort(-flux[candidates], kind="stable")]:
+        lo, hi = int(max(0, i - gap + 1)), int(min(len(flux), i + gap))
+        if not taken[lo:hi].any():
+            taken[i] = True
+            kept.append(i)
+    return np.sort(np.array(kept, dtype=np.int64))
+
+
+def sustain_frames(bands, onsets, max_frames, ratio=SUSTAIN_RATIO):
+    # How long the band that dominates each onset stays above ratio of its
+    # level there. A held tone keeps going under later onsets in other
+    # bands, so only max_frames bounds it.
+    lengths = np.zeros(len(onsets), np.int64)
+    for k, i in enumerate(onsets):
+        attack = bands[i:i + 3]
+        band = int(attack.max(axis=0).argmax())
+        level = attack[:, band].max()
+        below = np.flatnonzero(bands[i:i + max_frames, band] < ratio * level)
+        lengths[k] = below[0] if len(below) else min(max_frames, len(bands) - i)
+    return lengths
+
+
+def preferred_lanes(onsets, centroid, lanes, mode):
+    # alternate: round robin; pitch: lower sounding onsets to lower lanes,
+    # split into equal-sized groups by spectral centroid.
+    if mode == "alternate" or lanes == 1 or len(onsets) == 0:
+        return np.arange(len(onsets)) % lanes
+    pitch = centroid[onsets]
+    edges = np.quantile(pitch, np.linspace(0, 1, lanes + 1)[1:-1])
+    return np.searchsorted(edges, pitch, side="right")
+
+
+def place_notes(times, durations, preferred, lanes, long_threshold=LONG_NOTE_THRESHOLD, min_gap_ms=MIN_GAP_MS):
+    # Notes go to their preferred lane unless a hold is still running there,
+    # then to the nearest free lane. With every lane held, the hold that
+    # ends first is cut short min_gap_ms before the new note.
+    free_at = [float("-inf")] * lanes
+    last = [None] * lanes
+    notes = []
+    for t, duration, lane in zip(times, durations, preferred):
+        if free_at[lane] > t:
+            free = [l for l in range(lanes) if free_at[l] <= t]
+            if free:
+                lane = min(free, key=lambda l: abs(l - lane))
+            else:
+                lane = min(range(lanes), key=lambda l: free_at[l])
+                held = last[lane]
+                cut = t - min_gap_ms - held["time"]
+                if cut >= long_threshold:
+                    held["duration"] = cut
+                else:
+                    del held["duration"]
+        note = {"time": t, "side": lane}
+        free_at[lane] = t
+        if duration >= long_threshold:
+            note["duration"] = duration
+            free_at[lane] = t + duration + min_gap_ms
+        last[lane] = note
+        notes.append(note)
+    return notes
+
+
+def chart_audio(audio_path, lanes=LANES, mode="alternate", sensitivity=SENSITIVITY,
+                min_gap_ms=MIN_GAP_MS, long_threshold=LONG_NOTE_THRESHOLD):
+    samples, rate = resample(*decode(audio_path))
+    frame_ms = HOP * 1000.0 / rate
+    flux, bands, centroid = spectral_features(samples, rate)
+    onsets = pick_onsets(flux, frame_ms, sensitivity, min_gap_ms)
+    holds = sustain_frames(bands, onsets, int(MAX_HOLD_MS / frame_ms))
+    preferred = preferred_lanes(onsets, centroid, lanes, mode)
+    # frame i covers [i*HOP, i*HOP + FRAME), its onset is at the frame centre
+    times = ((onsets + FRAME / 2 / HOP) * frame_ms).round().astype(np.int64)
+    durations = (holds * frame_ms).round().astype(np.int64)
+    return place_notes(times.tolist(), durations.tolist(), preferred.tolist(), lanes, long_threshold, min_gap_ms)
+
+
+def chart_folder(folder, lanes=LANES, mode="alternate", sensitivity=SENSITIVITY,
+                 min_gap_ms=MIN_GAP_MS, force=False, dry_run=False):
+    # Returns a one line report; an existing non-empty chart is only replaced
+    # with force (and is kept as chart.json.bak).
+    folder = Path(folder)
+    t0 = time.perf_counter()
+    try:
+        meta = json.loads((folder / "level.json").read_text(encoding="utf-8"))
+        chart_path = folder / "chart.json"
+        if not force and chart_path.exists():
+            existing = json.loads(chart_path.read_text(encoding="utf-8")).get("notes", [])
+            if existing:
+                return f"{folder}: has {len(existing)} notes, skipped (use --force)"
+        audio = find_audio(folder, meta)
+        if audio is None:
+            return f"{folder}: no audio, skipped"
+        notes = chart_audio(audio, lanes, mode, sensitivity, min_gap_ms)
+        if not dry_run:
+            write_chart(chart_path, notes)
+    except Exception as e:
+        return f"{folder}: failed: {e}"
+    longs = sum(1 for n in notes if "duration" in n)
+    return f"{folder}: {len(notes)} notes ({longs} long) in {time.perf_counter() - t0:.2f}s"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate chart.json from a level's audio (spectral flux onsets).")
+    parser.add_argument("folders", nargs="+", help="song folders (with level.json)")
+    parser.add_argument("--lanes", type=int, default=LANES)
+    parser.add_argument("--mode", choices=("alternate", "pitch"), default="alternate",
+                        help="alternate lanes, or low to high by spectral centroid")
+    parser.add_argument("--sensitivity", type=float, default=SENSITIVITY, help="lower finds more notes")
+    parser.add_argument("--min-gap", type=float, default=MIN_GAP_MS, help="ms between notes")
+    parser.add_argument("--force", action="store_true", help="replace charts that already have notes")
+    parser.add_argument("--dry-run", action="store_true", help="analyse only, write nothing")
+    parser.add_argument("--jobs", type=int, default=1, help="worker processes")
+    args = parser.parse_args(argv)
+
+    options = (args.lanes, args.mode, args.sensitivity, args.min_gap, args.force, args.dry_run)
+    if args.jobs > 1:
+        with ProcessPoolExecutor(args.jobs) as pool:
+            futures = [pool.submit(chart_folder, folder, *options) for folder in args.folders]
+            reports = [f.result() for f in futures]
+    else:
+        reports = [chart_folder(folder, *options) for folder in args.folders]
+    for report in reports:
+        print(report)
+    return 1 if any(": failed:" in r for r in reports) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
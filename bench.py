@@ -0,0 +1,302 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import chartbin
+from engine import Engine
+from judgment import Judge
+from levelindex import LevelIndex, load_chart
+
+
+# --- Config ---
+# Same play field as game2buttonver.py
+WIDTH, HEIGHT = 400, 600
+SQUARE_SIZE = 50
+SPEED = 0.48  # pixels per ms
+HIT_ZONE_Y = HEIGHT - 100
+TRAVEL_TIME_MS = (HIT_ZONE_Y + SQUARE_SIZE) / SPEED
+LINGER_MS = (HEIGHT - HIT_ZONE_Y) / SPEED
+FRAME_MS = 1000 / 60
+
+BASELINE_FILE = Path("bench_baseline.json")
+REGRESSION = 1.25   # flag metrics this much slower than the baseline
+
+
+# --- Synthetic charts ---
+def dense_stream(seconds=300, nps=20, lanes=2, seed=1):
+    # Taps only, nps notes per second spread randomly over the lanes.
+    rng = random.Random(seed)
+    step = 1000 / nps
+    return [{"time": int(1000 + i * step), "side": rng.randrange(lanes)}
+            for i in range(int(seconds * nps))]
+
+
+def overlapping_holds(seconds=300, lanes=2, seed=2):
+    # Long holds on every lane at once with taps squeezed in between holds.
+    rng = random.Random(seed)
+    notes = []
+    for side in range(lanes):
+        t = 1000 + side * 150
+        while t < seconds * 1000:
+            duration = rng.randint(400, 2500)
+            notes.append({"time": t, "side": side, "duration": duration})
+            t += duration + 200
+            for _ in range(rng.randint(0, 3)):
+                notes.append({"time": t, "side": side})
+                t += 200
+    notes.sort(key=lambda n: n["time"])
+    return notes
+
+
+def six_lane(seconds=300, nps=16, seed=3):
+    # wip/chartscript.py layout: Z, X, then the four arrows, about 1 in 5 a hold.
+    rng = random.Random(seed)
+    notes = []
+    step = 1000 / nps
+    for i in range(int(seconds * nps)):
+        note = {"time": int(1000 + i * step), "side": rng.randrange(6)}
+        if rng.random() < 0.2:
+            note["duration"] = rng.randint(300, 1200)
+        notes.append(note)
+    return notes
+
+
+def chart_lanes(chart):
+    return max([n["side"] + 1 for n in chart] + [2])
+
+
+def autoplay(chart, seed=4):
+    # Press near every note (some early, some late, a few skipped) and hold
+    # long notes for their whole length.
+    rng = random.Random(seed)
+    events = []
+    for n in chart:
+        if rng.random() < 0.05:
+            continue
+        t = n["time"] + rng.gauss(0, 30)
+        events.append((t, n["side"], 1))
+        events.append((t + max(n.get("duration", 0), 40), n["side"], 0))
+    events.sort()
+    return events
+
+
+# --- Measurements ---
+def summarize(samples_ns):
+    samples = sorted(samples_ns)
+    if not samples:
+        return {}
+    pick = lambda p: samples[min(len(samples) - 1, int(len(samples) * p / 100))] / 1000.0
+    return {"n": len(samples), "p50_us": pick(50), "p90_us": pick(90), "p99_us": pick(99),
+            "max_us": samples[-1] / 1000.0, "total_ms": sum(samples) / 1e6}
+
+
+def bench_spawn(chart):
+    # Note object creation + lane queue insert, per note.
+    engine = Engine(chart_lanes(chart), TRAVEL_TIME_MS, LINGER_MS)
+    engine.load(chart, Judge())
+    samples = []
+    clock = time.perf_counter_ns
+    for n in chart:
+        t0 = clock()
+        engine.update(n["time"] - TRAVEL_TIME_MS)
+        samples.append(clock() - t0)
+    return summarize(samples)
+
+
+def bench_frames(chart):
+    # Whole song at 60 FPS with autoplay: per-frame engine.update() (spawn,
+    # miss expiry, hold scoring, retirement) and per-press engine.press().
+    engine = Engine(chart_lanes(chart), TRAVEL_TIME_MS, LINGER_MS)
+    engine.load(chart, Judge())
+    events = autoplay(chart)
+    end = engine.finish_time()
+    clock = time.perf_counter_ns
+    frames, presses = [], []
+    i = 0
+    now = 0.0
+    while now < end:
+        now += FRAME_MS
+        while i < len(events) and events[i][0] <= now:
+            t, lane, down = events[i]
+            t0 = clock()
+            if down:
+                engine.press(lane, t)
+                presses.append(clock() - t0)
+            else:
+                engine.release(lane, t)
+            i += 1
+        t0 = clock()
+        engine.update(now)
+        frames.append(clock() - t0)
+    return summarize(frames), summarize(presses)
+
+
+def bench_render(chart, frames=600):
+    # Renderer frame (erase, one batched blits, dirty-rect update) on SDL's
+    # dummy driver, through the busiest stretch.
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import pygame
+    from layout import Layout
+    from renderer import Renderer
+    pygame.display.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    lanes = chart_lanes(chart)
+    layout = Layout(lanes)
+    size = layout.square_size(WIDTH, SQUARE_SIZE)
+    renderer = Renderer(screen, layout.hit_zones(WIDTH, HIT_ZONE_Y, size), size, SPEED, layout.colors,
+                        (180, 180, 180), (100, 255, 100))
+    engine = Engine(lanes, TRAVEL_TIME_MS, LINGER_MS)
+    engine.load(chart, Judge())
+    start = chart[len(chart) // 2]["time"]
+    clock = time.perf_counter_ns
+    samples = []
+    for f in range(frames):
+        now = start + f * FRAME_MS
+        engine.update(now)
+        t0 = clock()
+        renderer.begin_frame()
+        renderer.draw_notes(engine.lanes, now, engine.scroll)
+        renderer.draw_hit_zones(engine.down)
+        renderer.end_frame()
+        samples.append(clock() - t0)
+    pygame.display.quit()
+    return summarize(samples)
+
+
+def bench_load(chart, repeat=20):
+    # Chart load: chart.json parsed into Note columns vs chart.bin mapped.
+    root = Path(tempfile.mkdtemp(prefix="rhythm-bench-"))
+    try:
+        (root / "chart.json").write_text(json.dumps({"notes": chart}, indent=4))
+        chartbin.load(root)
+        clock = time.perf_counter_ns
+        result = {}
+        t0 = clock()
+        for _ in range(repeat):
+            chartbin.Chart.from_notes(json.loads((root / "chart.json").read_text(encoding="utf-8"))["notes"])
+        result["json_ms"] = (clock() - t0) / 1e6 / repeat
+        t0 = clock()
+        for _ in range(repeat):
+            chartbin.load(root)
+        result["bin_ms"] = (clock() - t0) / 1e6 / repeat
+        result["bin_bytes"] = (root / chartbin.BIN_NAME).stat().st_size
+        result["json_bytes"] = (root / "chart.json").stat().st_size
+        return result
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def make_song_folders(root, count, chart):
+    for i in range(count):
+        folder = root / f"level{i}"
+        folder.mkdir()
+        (folder / "level.json").write_text(json.dumps({"name": f"Level {i}", "difficulty": "Medium",
+                                                       "audio": "song.ogg", "length_ms": 300000}))
+        (folder / "chart.json").write_text(json.dumps({"notes": chart}))
+        (folder / "song.ogg").write_bytes(b"")
+
+
+def bench_scan(folders, chart):
+    # LevelIndex.scan() with no index, with a fresh index, and after one chart changed.
+    root = Path(tempfile.mkdtemp(prefix="rhythm-bench-"))
+    try:
+        make_song_folders(root, folders, chart)
+        clock = time.perf_counter_ns
+        result = {}
+        t0 = clock()
+        LevelIndex(root).scan()
+        result["cold_ms"] = (clock() - t0) / 1e6
+        t0 = clock()
+        LevelIndex(root).scan()
+        result["warm_ms"] = (clock() - t0) / 1e6
+        changed = root / "level0" / "chart.json"
+        changed.write_text(json.dumps({"notes": chart[:-1]}))
+        t0 = clock()
+        LevelIndex(root).scan()
+        result["one_changed_ms"] = (clock() - t0) / 1e6
+        return result
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def run(args):
+    charts = {
+        "dense": dense_stream(args.seconds),
+        "holds": overlapping_holds(args.seconds),
+        "six_lane": six_lane(args.seconds),
+    }
+    bike = Path("songs") / "bike"
+    if (bike / "chart.json").exists():
+        charts["bike"] = load_chart(bike)
+    results = {}
+    for name, chart in charts.items():
+        print(f"--- {name}: {len(chart)} notes, {chart_lanes(chart)} lanes ---")
+        res = {"spawn": bench_spawn(chart)}
+        res["update"], res["press"] = bench_frames(chart)
+        if not args.no_render:
+            try:
+                res["render"] = bench_render(chart)
+            except ImportError as e:
+                print("Skipping render benchmark:", e)
+        for metric, stats in res.items():
+            print(f"  {metric:7s} p50 {stats['p50_us']:8.1f} us  p90 {stats['p90_us']:8.1f} us  "
+                  f"p99 {stats['p99_us']:8.1f} us  max {stats['max_us']:8.1f} us")
+        results[name] = res
+    scan_chart = charts["dense"][:400]
+    print(f"--- scan: {args.folders} folders ---")
+    results["scan"] = {"levels": bench_scan(args.folders, scan_chart)}
+    for key, value in results["scan"]["levels"].items():
+        print(f"  {key:15s} {value:8.1f} ms")
+    print(f"--- load: {len(charts['dense'])} notes ---")
+    results["load"] = {"chart": bench_load(charts["dense"])}
+    for key, value in results["load"]["chart"].items():
+        print(f"  {key:15s} {value:10.3f}" if key.endswith("_ms") else f"  {key:15s} {value:10d}")
+    return results
+
+
+def compare(results, baseline):
+    print(f"--- vs baseline (x{REGRESSION} = regression) ---")
+    regressions = 0
+    for name, metrics in results.items():
+        for metric, stats in metrics.items():
+            old = baseline.get(name, {}).get(metric)
+            if not old:
+                continue
+            for key in ("p50_us", "p99_us", "cold_ms", "warm_ms", "one_changed_ms", "json_ms", "bin_ms"):
+                if key in stats and old.get(key):
+                    ratio = stats[key] / old[key]
+                    flag = "  REGRESSION" if ratio > REGRESSION else ""
+                    regressions += bool(flag)
+                    print(f"  {name}.{metric}.{key}: {old[key]:.1f} -> {stats[key]:.1f} (x{ratio:.2f}){flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the rhythm game hot paths.")
+    parser.add_argument("--seconds", type=int, default=300, help="length of the synthetic charts")
+    parser.add_argument("--folders", type=int, default=300, help="song folders for the scan benchmark")
+    parser.add_argument("--no-render", action="store_true", help="skip the pygame render benchmark")
+    parser.add_argument("--baseline", default=str(BASELINE_FILE), help="baseline file")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"Baseline saved to {baseline_path}")
+        return 0
+    if baseline_path.exists():
+        regressions = compare(results, json.loads(baseline_path.read_text(encoding="utf-8")))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from pathlib import Path
+
+
+# --- Packed chart format ---
+# chart.bin, little endian:
+#   header   "RCHT", u16 version, u16 flags, u32 note count n,
+#            u64 size and i64 mtime_ns of the chart.json it was built from
+#   times    u32[n]  note time in ms, sorted
+#   durations u32[n] hold length in ms, 0 for taps
+#   sides    u8[n]   lane
+# and, when flags has SPEEDS set, the chart's scroll speed changes:
+#   u32 m, then m x (u32 time ms, f64 speed)
+# 9 bytes per note. Each column is a plain array at a fixed offset, so it can
+# be mapped without parsing: memoryview(...).cast("I") here, or
+# numpy.frombuffer(data, "<u4", n, offset) elsewhere.
+MAGIC = b"RCHT"
+VERSION = 2
+HEADER = struct.Struct("<4sHHIQq")
+COUNT = struct.Struct("<I")
+SPEED = struct.Struct("<Id")
+SPEEDS = 1     # flags bit
+BIN_NAME = "chart.bin"
+JSON_NAME = "chart.json"
+
+
+class Chart:
+    # Column view of a chart, what the engine plays from. Built from
+    # chart.json notes or mapped straight from chart.bin. speeds is the
+    # chart's scroll speed changes, [(time_ms, speed), ...] (see scroll.py).
+    def __init__(self, times, sides, durations, source=None, speeds=()):
+        self.times = times
+        self.sides = sides
+        self.durations = durations
+        self.speeds = list(speeds)
+        self._source = source   # keeps the mmap alive
+
+    def __len__(self):
+        return len(self.times)
+
+    @classmethod
+    def from_notes(cls, notes, speeds=()):
+        # Times are unsigned: a note before the song start (a chart nudged by
+        # a calibration) is moved to 0 ms rather than failing the level.
+        notes = sorted(notes, key=lambda n: n["time"])
+        try:
+            return cls(array("I", [max(int(n["time"]), 0) for n in notes]),
+                       array("B", [int(n["side"]) for n in notes]),
+                       array("I", [max(int(n.get("duration", 0)), 0) for n in notes]),
+                       speeds=speeds)
+        except OverflowError as e:
+            raise ValueError(f"note time or lane out of range: {e}")
+
+    @classmethod
+    def from_json(cls, data):
+        # chart.json contents: {"notes": [...], "speeds": [{"time", "speed"}, ...]}
+        speeds = sorted((max(int(s["time"]), 0), float(s["speed"])) for s in data.get("speeds", []))
+        return cls.from_notes(data.get("notes", []), speeds)
+
+    def to_notes(self):
+        notes = []
+        for t, side, duration in zip(self.times, self.sides, self.durations):
+            note = {"time": t, "side": side}
+            if duration > 0:
+                note["duration"] = duration
+            notes.append(note)
+        return notes
+
+    def end_time(self):
+        return max((t + d for t, d in zip(self.times, self.durations)), default=0)
+
+
+def source_signature(json_path):
+    # chart.bin is only used while chart.json still has exactly this size and
+    # mtime: a copied-in chart can be older than the cache it replaces
+    st = Path(json_path).stat()
+    return st.st_size, st.st_mtime_ns
+
+
+def pack(chart, source=(0, 0)):
+    count = len(chart)
+    times = array("I", chart.times)
+    durations = array("I", chart.durations)
+    sides = array("B", chart.sides)
+    if sys.byteorder != "little":
+        times.byteswap()
+        durations.byteswap()
+    flags = SPEEDS if chart.speeds else 0
+    data = HEADER.pack(MAGIC, VERSION, flags, count, *source) + times.tobytes() + durations.tobytes() + sides.tobytes()
+    if chart.speeds:
+        data += COUNT.pack(len(chart.speeds)) + b"".join(SPEED.pack(t, s) for t, s in chart.speeds)
+    return data
+
+
+def write_bin(path, chart, source=(0, 0)):
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(pack(chart, source))
+    os.replace(tmp, path)
+
+
+def read_bin(path, source=None):
+    # With source, a chart.bin built from another chart.json is rejected.
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < HEADER.size:
+            raise ValueError(f"{path}: truncated header")
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, flags, count, *built_from = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path}: not a version {VERSION} chart.bin")
+    if source is not None and tuple(built_from) != tuple(source):
+        raise ValueError(f"{path}: built from a different chart.json")
+    end = HEADER.size + 9 * count
+    speeds = []
+    if flags & SPEEDS and size >= end + COUNT.size:
+        m = COUNT.unpack_from(data, end)[0]
+        speeds = [SPEED.unpack_from(data, end + COUNT.size + i * SPEED.size) for i in range(m)]
+        end += COUNT.size + m * SPEED.size
+    if size != end:
+        raise ValueError(f"{path}: expected {count} notes, size does not match")
+    view = memoryview(data)
+    start = HEADER.size
+    if sys.byteorder == "little":
+        times = view[start:start + 4 * count].cast("I")
+        durations = view[start + 4 * count:start + 8 * count].cast("I")
+    else:
+        times = array("I", view[start:start + 4 * count])
+        durations = array("I", view[start + 4 * count:start + 8 * count])
+        times.byteswap()
+        durations.byteswap()
+    sides = view[start + 8 * count:start + 9 * count]
+    return Chart(times, sides, durations, source=data, speeds=speeds)
+
+
+def load(folder, cache=True):
+    # chart.bin when it was built from chart.json as it is now, otherwise
+    # parse the json and (with cache) write chart.bin for next time.
+    folder = Path(folder)
+    bin_path = folder / BIN_NAME
+    json_path = folder / JSON_NAME
+    source = source_signature(json_path)
+    try:
+        return read_bin(bin_path, source)
+    except (OSError, ValueError):
+        pass
+    chart = Chart.from_json(json.loads(json_path.read_text(encoding="utf-8")))
+    if cache:
+        try:
+            write_bin(bin_path, chart, source)
+        except OSError as e:
+            print("Warning: could not write chart.bin:", e)
+    return chart
+
+
+def convert(json_path, check=False):
+    json_path = Path(json_path)
+    source = source_signature(json_path)
+    chart = Chart.from_json(json.loads(json_path.read_text(encoding="utf-8")))
+    bin_path = json_path.with_name(BIN_NAME)
+    write_bin(bin_path, chart, source)
+    if check:
+        # round trip: json -> bin -> notes must give back the sorted json notes
+        back = read_bin(bin_path, source)
+        if back.to_notes() != chart.to_notes() or back.speeds != chart.speeds:
+            raise ValueError(f"{bin_path}: round trip mismatch")
+    return bin_path, len(chart), bin_path.stat().st_size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert chart.json files to packed chart.bin.")
+    parser.add_argument("paths", nargs="+", help="chart.json files or song folders (searched recursively)")
+    parser.add_argument("--check", action="store_true", help="verify every file round-trips")
+    args = parser.parse_args(argv)
+    failed = 0
+    for path in map(Path, args.paths):
+        targets = [path] if path.is_file() else sorted(path.rglob(JSON_NAME))
+        for json_path in targets:
+            try:
+                bin_path, count, size = convert(json_path, args.check)
+                print(f"{bin_path}: {count} notes, {size} bytes ({json_path.stat().st_size} as json)")
+            except (OSError, ValueError) as e:
+                print(f"{json_path}: {e}")
+                failed += 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
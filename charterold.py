@@ -1,13 +1,18 @@
 import pygame
-import json
 import sys
-import os
+from charting import NoteRecorder, EventPump, ChartJournal, recover_journal, apply_controls, LONG_NOTE_THRESHOLD
+from controls import Controls
+from hitsound import HitSounds, pre_init
+from gpio_input import GpioInput
+from layout import Layout
+from songclock import SongClock, load_offset
 
 # --- Config ---
 WIDTH, HEIGHT = 400, 300
-FPS = 60
 CIRCLE_RADIUS = 50
-LONG_NOTE_THRESHOLD = 250  # ms
+CHART_FILE = "chart.json"
+LEFT_PIN = 23
+RIGHT_PIN = 4
 
 # Colors
 WHITE = (255, 255, 255)
@@ -18,17 +23,25 @@ GREEN = (100, 255, 100)
 GRAY = (150, 150, 150)
 
 # --- Initialize ---
+pre_init()   # small mixer buffer, the press clicks come back right away
 pygame.init()
 pygame.mixer.init()
+sounds = HitSounds()
 screen = pygame.display.set_mode((WIDTH, HEIGHT))
 pygame.display.set_caption("Rhythm Game Charter")
-clock = pygame.time.Clock()
+font = pygame.font.SysFont(None, 36)
 
 # --- Game Variables ---
-key_pressed = {pygame.K_LEFT: False, pygame.K_RIGHT: False}
-press_start_time = {pygame.K_LEFT: None, pygame.K_RIGHT: None}
-notes = []  # collected notes
-song_start_time = None
+# A journal left by a crashed session is saved into the chart first
+recovered = recover_journal(CHART_FILE)
+if recovered:
+    print(f"Recovered {recovered} notes from an unfinished session into {CHART_FILE}")
+journal = ChartJournal(CHART_FILE)
+recorder = NoteRecorder(LONG_NOTE_THRESHOLD, journal=journal)
+buttons = GpioInput([LEFT_PIN, RIGHT_PIN])
+buttons.start()
+# arrow keys, GPIO buttons, joystick left / right and buttons 0 / 1
+controls = Controls(Layout(2), buttons)
 
 # Circles positions
 left_circle = (WIDTH // 4, HEIGHT // 2)
@@ -36,72 +49,44 @@ right_circle = (3 * WIDTH // 4, HEIGHT // 2)
 
 # --- Load song ---
 SONG_FILE = "bike.mp3"  # Change to your song file
+song_clock = SongClock(pygame.mixer.music.get_pos, load_offset())
+pump = EventPump(song_clock)
 pygame.mixer.music.load(SONG_FILE)
 pygame.mixer.music.play()
-song_start_time = pygame.time.get_ticks()
+song_clock.start()
 
 # --- Main Loop ---
 running = True
 while running:
-    dt = clock.tick(FPS)
-    screen.fill(BLACK)
-
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-
-    # Current song time
-    song_time = pygame.time.get_ticks() - song_start_time
-
-    # Input handling
-    keys = pygame.key.get_pressed()
+    # Input is handled as it arrives, drawing happens at FPS
+    events, song_time, draw = pump.poll()
+    running = apply_controls(events, controls, recorder, song_time, sounds)
+    journal.maybe_sync()
+    if not draw:
+        continue
 
-    for side, key in enumerate([pygame.K_LEFT, pygame.K_RIGHT]):
-        # Key pressed
-        if keys[key]:
-            if not key_pressed[key]:
-                key_pressed[key] = True
-                press_start_time[key] = song_time
-        # Key released
-        else:
-            if key_pressed[key]:
-                key_pressed[key] = False
-                start_time = press_start_time[key]
-                duration = song_time - start_time if start_time is not None else 0
-
-                if duration >= LONG_NOTE_THRESHOLD:
-                    notes.append({"time": start_time, "side": side, "duration": duration})
-                    print(f"Recorded LONG note: start={start_time}, side={side}, duration={duration}")
-                else:
-                    notes.append({"time": start_time, "side": side})
-                    print(f"Recorded TAP note: time={start_time}, side={side}")
-
-                press_start_time[key] = None
+    screen.fill(BLACK)
 
     # --- Draw circles ---
     # Left
-    if key_pressed[pygame.K_LEFT]:
+    if recorder.is_down(0):
         pygame.draw.circle(screen, GRAY, left_circle, CIRCLE_RADIUS)
     pygame.draw.circle(screen, RED, left_circle, CIRCLE_RADIUS, 5)
 
     # Right
-    if key_pressed[pygame.K_RIGHT]:
+    if recorder.is_down(1):
         pygame.draw.circle(screen, GRAY, right_circle, CIRCLE_RADIUS)
     pygame.draw.circle(screen, BLUE, right_circle, CIRCLE_RADIUS, 5)
 
     # Show current time
-    font = pygame.font.SysFont(None, 36)
-    text = font.render(f"Time: {song_time} ms", True, GREEN)
+    text = font.render(f"Time: {int(song_time)} ms", True, GREEN)
     screen.blit(text, (10, 10))
 
     pygame.display.flip()
 
-# --- Save chart (sorted by time) ---
-notes.sort(key=lambda n: n["time"])
-chart_data = {"notes": notes}
-with open("chart.json", "w") as f:
-    json.dump(chart_data, f, indent=4)
-
-print("Chart saved to chart.json")
+# --- Save chart (journal compacted into a sorted chart.json) ---
+notes = journal.close()
+print(f"Chart saved to {CHART_FILE} ({len(notes)} notes)")
+buttons.stop()
 pygame.quit()
-sys.exit()
\ No newline at end of file
+sys.exit()
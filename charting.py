@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+
+import pygame
+
+
+# --- Config ---
+LONG_NOTE_THRESHOLD = 250  # ms
+FPS = 60                   # drawing only, input is not tied to frames
+JOURNAL_SYNC_MS = 1000     # fsync the journal at most this often
+
+
+# --- Journal ---
+# While recording, every finished note is appended as one JSON line to
+# chart.json.journal and flushed; fsync runs at most every JOURNAL_SYNC_MS.
+# chart.json itself is only written when the journal is compacted, on save
+# or when a leftover journal from a crashed session is recovered.
+def journal_path(chart_path):
+    return Path(str(chart_path) + ".journal")
+
+
+def read_journal(path):
+    # A torn last line (power cut mid-write) is skipped, the rest is kept.
+    notes = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and "time" in record and "side" in record:
+                notes.append(record)
+    return notes
+
+
+def write_chart(chart_path, notes):
+    # Sorted, atomic, and the previous chart is kept as chart.json.bak.
+    # Anything else in the chart (scroll "speeds") is carried over.
+    chart_path = Path(chart_path)
+    notes = sorted(notes, key=lambda n: (n["time"], n["side"]))
+    try:
+        data = json.loads(chart_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        data = {}
+    if not isinstance(data, dict):
+        data = {}
+    data["notes"] = notes
+    tmp = chart_path.with_name(chart_path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    if chart_path.exists():
+        os.replace(chart_path, chart_path.with_name(chart_path.name + ".bak"))
+    os.replace(tmp, chart_path)
+    return notes
+
+
+def recover_journal(chart_path):
+    # Compacts a journal left behind by a crash into chart.json; returns the
+    # number of notes recovered (0 when there was nothing to recover).
+    path = journal_path(chart_path)
+    if not path.exists():
+        return 0
+    notes = read_journal(path)
+    if notes:
+        write_chart(chart_path, notes)
+    path.unlink()
+    return len(notes)
+
+
+class ChartJournal:
+    def __init__(self, chart_path, sync_ms=JOURNAL_SYNC_MS):
+        self.chart_path = Path(chart_path)
+        self.path = journal_path(chart_path)
+        self.sync_ms = sync_ms
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.last_sync = time.monotonic()
+        self.dirty = False
+
+    def append(self, note):
+        self.file.write(json.dumps(note, separators=(",", ":")) + "\n")
+        self.file.flush()
+        self.dirty = True
+        self.maybe_sync()
+
+    def maybe_sync(self):
+        if self.dirty and (time.monotonic() - self.last_sync) * 1000 >= self.sync_ms:
+            os.fsync(self.file.fileno())
+            self.last_sync = time.monotonic()
+            self.dirty = False
+
+    def close(self):
+        # Compacts the session into chart.json and removes the journal.
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        notes = write_chart(self.chart_path, read_journal(self.path))
+        self.path.unlink()
+        return notes
+
+
+class NoteRecorder:
+    # Turns timestamped press/release pairs into chart notes. Times are song
+    # ms from the audio clock, so a note is exactly where the key went down,
+    # not where the next frame happened to be.
+    def __init__(self, long_threshold=LONG_NOTE_THRESHOLD, verbose=True, journal=None):
+        self.long_threshold = long_threshold
+        self.verbose = verbose
+        self.journal = journal
+        self.notes = []
+        self.down = {}   # lane -> press time
+
+    def press(self, lane, t):
+        if lane not in self.down:
+            self.down[lane] = t
+
+    def release(self, lane, t):
+        start = self.down.pop(lane, None)
+        if start is None:
+            return None
+        time_ms = int(round(start))
+        duration = int(round(t - start))
+        if duration >= self.long_threshold:
+            note = {"time": time_ms, "side": lane, "duration": duration}
+            if self.verbose:
+                print(f"Recorded LONG note: start={time_ms}, side={lane}, duration={duration}")
+        else:
+            note = {"time": time_ms, "side": lane}
+            if self.verbose:
+                print(f"Recorded TAP note: time={time_ms}, side={lane}")
+        self.notes.append(note)
+        if self.journal is not None:
+            self.journal.append(note)
+        return note
+
+    def is_down(self, lane):
+        return lane in self.down
+
+
+class EventPump:
+    # Sleeps in the SDL event queue between frames instead of in
+    # clock.tick(), so KEYDOWN/KEYUP are handled (and stamped with the song
+    # clock) as soon as they arrive. poll() returns (events, song_time, draw)
+    # where draw is True once per 1/FPS.
+    def __init__(self, song_clock, fps=FPS):
+        self.song_clock = song_clock
+        self.frame_ms = 1000 / fps
+        self.next_frame = 0
+
+    def poll(self):
+        wait = int(self.next_frame - pygame.time.get_ticks())
+        events = []
+        if wait > 0:
+            event = pygame.event.wait(wait)
+            if event.type != pygame.NOEVENT:
+                events.append(event)
+        events += pygame.event.get()
+        song_time = self.song_clock.time()
+        draw = pygame.time.get_ticks() >= self.next_frame
+        if draw:
+            self.next_frame = pygame.time.get_ticks() + self.frame_ms
+        return events, song_time, draw
+
+
+def apply_controls(events, controls, recorder, song_time, sounds=None):
+    # Keys, joystick and GPIO buttons all come through controls.Controls,
+    # already timestamped. Every press clicks on sounds (hitsound.HitSounds)
+    # when given. Returns False when the window was closed.
+    running = True
+    for event in events:
+        if event.type == pygame.QUIT:
+            running = False
+        else:
+            controls.handle(event)
+    for t, lane, pressed in controls.song_events(song_time):
+        if pressed:
+            recorder.press(lane, t)
+            if sounds is not None:
+                sounds.play("tick")
+        else:
+            recorder.release(lane, t)
+    return running
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recover charts from leftover charting journals.")
+    parser.add_argument("charts", nargs="+", help="chart.json paths (the .journal next to each is read)")
+    args = parser.parse_args()
+    for chart in args.charts:
+        count = recover_journal(chart)
+        print(f"{chart}: recovered {count} notes" if count else f"{chart}: nothing to recover")
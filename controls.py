@@ -0,0 +1,167 @@
+import pygame
+
+from gpio_input import PinEvent, now_ms
+
+
+# --- Config ---
+DEADZONE = 0.5          # stick travel (0..1) that counts as a press
+RELEASE_RATIO = 0.7     # ...and is released again below DEADZONE * this
+# per device edge filter, GPIO pins are debounced in gpio_input itself
+DEBOUNCE_MS = {"key": 0, "joy": 10}
+DIRECTIONS = ("left", "right", "up", "down")
+HAT_DIRECTIONS = {"left": (0, -1), "right": (0, 1), "up": (1, 1), "down": (1, -1)}   # (axis of the hat value, sign)
+STICK_AXES = {0: ("left", "right"), 1: ("up", "down")}   # axis -> (negative, positive)
+
+
+class Controls:
+    # One input layer for the game and the charters. Keyboard, joystick
+    # (buttons, hat, stick axes) and GPIO buttons all become the same
+    # PinEvent(time, lane, pressed), timestamped with now_ms() as they
+    # arrive. Nothing is polled per frame: pygame events go through handle()
+    # and GPIO edges are already queued by their own thread, drain() returns
+    # everything in time order.
+    # A lane is down while any input bound to it is down, so a key and a
+    # joystick button on one lane give one press and one release.
+    #   layout      layout.Layout: lane keys, arrow keys also bind the
+    #               matching joystick direction, button i plays lane i
+    #   buttons     optional gpio_input.GpioInput, pin i plays lane i
+    #   deadzone    stick travel that counts as a press
+    #   debounce_ms {"key": ms, "joy": ms}, edges of one input closer than
+    #               this are dropped and the input re-read afterwards
+    def __init__(self, layout, buttons=None, deadzone=DEADZONE, debounce_ms=None):
+        self.buttons = buttons
+        self.deadzone = deadzone
+        self.debounce_ms = dict(DEBOUNCE_MS, **(debounce_ms or {}))
+        self.joysticks = {}     # instance id -> pygame Joystick
+        self.events = []
+        self.bounces = 0
+        self.set_layout(layout)
+
+    def set_layout(self, layout):
+        self.lanes = layout.lanes
+        self.lane_of_key = layout.lane_of_key
+        self.lane_of_direction = {pygame.key.name(key): lane for key, lane in layout.lane_of_key.items()
+                                  if pygame.key.name(key) in DIRECTIONS}
+        self.reset()
+
+    def reset(self):
+        # Everything counts as released (new level, seek); inputs still held
+        # only play again once pressed again.
+        self.held = [set() for _ in range(self.lanes)]   # inputs holding each lane down
+        self.state = {}          # input -> (down, last edge time)
+        self.recheck = {}        # input -> lane, for edges dropped by the debounce
+        self.events = []
+
+    def is_down(self, lane):
+        return bool(self.held[lane])
+
+    # --- Devices ---
+    def handle(self, event, play=True):
+        # Returns True when the event was a lane input. With play False only
+        # joystick hotplugging is handled and keys are left to the caller.
+        kind = event.type
+        if kind == pygame.JOYDEVICEADDED:
+            stick = pygame.joystick.Joystick(event.device_index)
+            self.joysticks[stick.get_instance_id()] = stick
+            return False
+        if kind == pygame.JOYDEVICEREMOVED:
+            self.joysticks.pop(event.instance_id, None)
+            for source in [s for s in self.state if s[0] == "joy" and s[1] == event.instance_id]:
+                self._edge(source, None, False, now_ms(), force=True)
+            return False
+        if not play:
+            return False
+        t = now_ms()
+        if kind in (pygame.KEYDOWN, pygame.KEYUP):
+            lane = self.lane_of_key.get(event.key)
+            if lane is None:
+                return False
+            self._edge(("key", event.key), lane, kind == pygame.KEYDOWN, t)
+            return True
+        if kind in (pygame.JOYBUTTONDOWN, pygame.JOYBUTTONUP):
+            if event.button >= self.lanes:
+                return False
+            self._edge(("joy", event.instance_id, "button", event.button), event.button,
+                       kind == pygame.JOYBUTTONDOWN, t)
+            return True
+        if kind == pygame.JOYHATMOTION:
+            for direction, (axis, sign) in HAT_DIRECTIONS.items():
+                lane = self.lane_of_direction.get(direction)
+                if lane is not None:
+                    self._edge(("joy", event.instance_id, "hat", event.hat, direction), lane,
+                               event.value[axis] == sign, t)
+            return True
+        if kind == pygame.JOYAXISMOTION and event.axis in STICK_AXES:
+            for direction, sign in zip(STICK_AXES[event.axis], (-1, 1)):
+                lane = self.lane_of_direction.get(direction)
+                if lane is not None:
+                    source = ("joy", event.instance_id, "axis", event.axis, direction)
+                    self._edge(source, lane, self._stick_down(source, event.value * sign), t)
+            return True
+        return False
+
+    def _stick_down(self, source, travel):
+        # hysteresis: a held direction lets go only well inside the dead zone
+        down = self.state.get(source, (False, 0))[0]
+        return travel > (self.deadzone * RELEASE_RATIO if down else self.deadzone)
+
+    def _read(self, source):
+        # Current level of a joystick input, for re-checking after a bounce.
+        stick = self.joysticks.get(source[1])
+        if stick is None:
+            return False
+        if source[2] == "button":
+            return bool(stick.get_button(source[3]))
+        if source[2] == "hat":
+            axis, sign = HAT_DIRECTIONS[source[4]]
+            return stick.get_hat(source[3])[axis] == sign
+        sign = -1 if source[4] == STICK_AXES[source[3]][0] else 1
+        return self._stick_down(source, stick.get_axis(source[3]) * sign)
+
+    # --- Lane state ---
+    def _edge(self, source, lane, pressed, t, force=False):
+        down, last = self.state.get(source, (False, float("-inf")))
+        if pressed == down:
+            return
+        if not force and t - last < self.debounce_ms.get(source[0], 0):
+            self.bounces += 1
+            if source[0] == "joy":
+                self.recheck[source] = lane
+            return
+        self.state[source] = (pressed, t)
+        if lane is None:
+            lane = next((i for i, held in enumerate(self.held) if source in held), None)
+            if lane is None:
+                return
+        held = self.held[lane]
+        if pressed:
+            if not held:
+                self.events.append(PinEvent(t, lane, True))
+            held.add(source)
+        elif source in held:
+            held.discard(source)
+            if not held:
+                self.events.append(PinEvent(t, lane, False))
+
+    def drain(self):
+        # Everything since the last drain, in time order.
+        t = now_ms()
+        for source, lane in list(self.recheck.items()):
+            # a joystick input whose last edge was dropped is re-read once
+            # its debounce window is over, so it cannot stay stuck down
+            if t - self.state[source][1] >= self.debounce_ms["joy"]:
+                del self.recheck[source]
+                self._edge(source, lane, self._read(source), t)
+        if self.buttons is not None:
+            for ev in self.buttons.drain():
+                if ev.lane < self.lanes:
+                    self._edge(("gpio", ev.lane), ev.lane, ev.pressed, ev.time, force=True)
+        events = self.events
+        self.events = []
+        events.sort(key=lambda ev: ev.time)
+        return events
+
+    def song_events(self, song_time):
+        # drain() with each timestamp moved onto the song clock: (t, lane, pressed)
+        now = now_ms()
+        return [(song_time - (now - ev.time), ev.lane, ev.pressed) for ev in self.drain()]
@@ -0,0 +1,170 @@
+from bisect import bisect_left
+
+from chartbin import Chart
+from judgment import Judge, JUDGMENTS, MAX_SCORE
+from notes import Note, LaneQueues
+from scroll import ScrollTable
+
+
+# --- Config ---
+HOLD_POINT_RATE = 0.15  # points per ms held (the old 5 points every 2 frames at 60 FPS)
+
+
+class Engine:
+    # Gameplay core. Everything is a function of song time in ms: notes
+    # spawn, get judged, missed and retired at fixed points on the timeline,
+    # and holds score for the milliseconds the lane was actually down. The
+    # frame rate only decides how often update() is called, never the result.
+    #   travel_time_ms - how long a note is on screen before its time
+    #   linger_ms      - how long a missed note keeps falling after its end
+    #   speed          - the player's scroll speed multiplier
+    # travel and linger are at scroll speed 1; with speed changes (the chart's
+    # or the player's) they are distances on the ScrollTable, so spawn and
+    # retire times move with the scroll speed.
+    def __init__(self, lanes=2, travel_time_ms=1000.0, linger_ms=0.0, speed=1.0):
+        self.lane_count = lanes
+        self.travel_time_ms = travel_time_ms
+        self.linger_ms = linger_ms
+        self.speed = speed
+        self.load([])
+
+    def load(self, chart, judge=None, lanes=None):
+        # chart is a chartbin.Chart; a list of chart.json note dicts also works.
+        # lanes changes the lane count for this and later charts.
+        if not isinstance(chart, Chart):
+            chart = Chart.from_notes(chart)
+        if lanes is not None:
+            self.lane_count = lanes
+        self.chart = chart
+        self.judge = judge or Judge()
+        # spawn times come from the scroll table once per load: a note
+        # appears when the field is travel_time_ms of scrolling before it
+        self.scroll = ScrollTable(chart.speeds, self.speed)
+        self.positions = self.scroll.positions_of(chart.times)
+        self.spawn_times = self.scroll.times_at([p - self.travel_time_ms for p in self.positions])
+        self._reset()
+        self.time = float("-inf")
+        self.perfect_possible = len(chart) * MAX_SCORE + sum(chart.durations) * HOLD_POINT_RATE
+
+    def _reset(self):
+        self.lanes = LaneQueues(self.lane_count)
+        self.down = [False] * self.lane_count
+        self.note_index = 0
+        self.score = 0.0
+        self.judgment = ""
+        self.judgment_time = None
+        self.counts = {msg: 0 for _, msg, _ in JUDGMENTS}
+        self.inputs = []   # (t, lane, down) as applied, for replays
+        self.judged = []   # (note_time, lane, offset_ms or None when never pressed, message)
+
+    def seek(self, t):
+        # Practice: play on from song time t without reloading the chart.
+        # Notes whose miss window closed before t are skipped with a bisect on
+        # the sorted note times and only the ones on screen at t are spawned,
+        # so this is O(log n + visible notes). Score and counts start over.
+        self._reset()
+        self.note_index = bisect_left(self.chart.times, t - self.judge.miss)
+        self.time = t
+        self.update(t)
+
+    def perfect_between(self, start, end):
+        # Best possible score for the notes with start <= time < end.
+        times = self.chart.times
+        i, j = bisect_left(times, start), bisect_left(times, end)
+        return (j - i) * MAX_SCORE + sum(self.chart.durations[i:j]) * HOLD_POINT_RATE
+
+    def finish_time(self):
+        # Song time by which the last note has been judged and left the screen.
+        end = self.scroll.position(self.chart.end_time()) + max(self.travel_time_ms, self.linger_ms)
+        return self.scroll.time_at(end) + 1
+
+    @property
+    def done(self):
+        return self.note_index >= len(self.chart) and not self.lanes
+
+    # Inputs older than the last update (a late GPIO drain) are applied at the
+    # current time, so a replay of self.inputs gives the exact same result.
+    def press(self, lane, t):
+        t = max(t, self.time)
+        self.inputs.append((t, lane, 1))
+        self.update(t)
+        if self.down[lane]:
+            return None
+        self.down[lane] = True
+        # holds only score while down, so resume them from now
+        for note in self.lanes.holding[lane]:
+            if note.scored_until < t:
+                note.scored_until = t
+        target = self.lanes.next(lane)
+        if target is None:
+            return None
+        result = self.judge.judge(t - target.note_time)
+        if result is None:
+            return None
+        pts, msg = result
+        self._judged(pts, msg, t, target, t - target.note_time)
+        if pts > 0:
+            self.lanes.hit(lane)
+            target.scored_until = max(target.note_time, t)
+        else:
+            self.lanes.drop(lane)
+        return result
+
+    def release(self, lane, t):
+        t = max(t, self.time)
+        self.inputs.append((t, lane, 0))
+        self.update(t)
+        self.down[lane] = False
+
+    def spawn(self, t):
+        # Adds everything that is on screen by t. update() starts with this,
+        # calling it first only splits the work (the game profiles the two).
+        chart = self.chart
+        spawn_times = self.spawn_times
+        count = len(spawn_times)
+        scroll = self.scroll
+        lanes = self.lanes
+        i = self.note_index
+        while i < count and spawn_times[i] <= t:
+            duration = chart.durations[i]
+            pos = self.positions[i]
+            end_pos = scroll.position(chart.times[i] + duration) if duration else pos
+            lanes.add(Note(chart.sides[i], chart.times[i], spawn_times[i], duration, pos, end_pos))
+            i += 1
+        self.note_index = i
+
+    def update(self, t):
+        if t < self.time:
+            t = self.time
+        self.time = t
+        lanes = self.lanes
+        miss = self.judge.miss
+        scroll = self.scroll
+        self.spawn(t)
+        position = scroll.position(t)
+        # one pass over the lanes' queues side by side; a lane with nothing
+        # on screen costs three empty-deque checks
+        for side, pending, holding, missed, down in zip(range(self.lane_count), lanes.pending,
+                                                        lanes.holding, lanes.missed, self.down):
+            while pending and t > pending[0].note_time + miss:
+                note = lanes.miss(side)
+                self._judged(0, "Miss", note.note_time + miss, note)
+            if holding:
+                if down:
+                    for note in holding:
+                        stop = min(t, note.end_time)
+                        if stop > note.scored_until:
+                            self.score += (stop - note.scored_until) * HOLD_POINT_RATE
+                            note.scored_until = stop
+                # long notes being held go once the tail has fully passed
+                while holding and position > holding[0].end_pos + self.travel_time_ms:
+                    lanes.retire_holding(side)
+            while missed and position > missed[0].end_pos + self.linger_ms:
+                lanes.retire_missed(side)
+
+    def _judged(self, pts, msg, t, note, offset=None):
+        self.score += pts
+        self.counts[msg] += 1
+        self.judgment = msg
+        self.judgment_time = t
+        self.judged.append((note.note_time, note.side, offset, msg))
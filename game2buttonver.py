@@ -7,24 +7,38 @@ import tkinter as tk
 from tkinter import filedialog
 from tkinter import simpledialog
 import shutil
-import RPi.GPIO as GPIO
+from gpio_input import GpioInput
+from judgment import Judge, JUDGMENTS, windows_for
+from engine import Engine
+from scores import ScoreStore
+from renderer import Renderer
+from layout import Layout, layout_for, MAX_LANES, PALETTE
+from controls import Controls, DEADZONE
+from hitsound import HitSounds, pre_init, MIXER_BUFFER
+from profiler import FrameProfiler, OVERLAY_SIZE
+from songclock import SongClock, load_offset, save_offset, OFFSET_STEP, load_setting, save_setting
+from scroll import clamp_multiplier, MULTIPLIER_STEP
+from textcache import TextCache
+from levelindex import LevelIndex
+from songwatch import SongWatcher
+from preview import get_preview
+from assets import AssetCache, audio_duration_ms, load_music
 
 
 # --- Config ---
 WIDTH, HEIGHT = 400, 600
 FPS = 60
 SQUARE_SIZE = 50
-SPEED = 8  # pixels per frame
+SPEED = 0.48  # pixels per ms at scroll speed 1 (8 px per frame at 60 FPS)
 HIT_ZONE_Y = HEIGHT - 100
 JUDGMENT_DISPLAY = 1000  # milliseconds
-HIT_DISTANCE_THRESHOLD = 70
-HOLD_POINT_RATE = 0.1  # points per ms while holding
+SEEK_STEP_MS = 5000      # practice mode , / . jump
+PROFILE_KEY = pygame.K_F3  # frame time overlay, in any screen
 
-GPIO.setmode(GPIO.BCM)
 LEFT_PIN = 23
 RIGHT_PIN = 4
-GPIO.setup(LEFT_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-GPIO.setup(RIGHT_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+buttons = GpioInput([LEFT_PIN, RIGHT_PIN])
+buttons.start()
 
 # Colors
 WHITE = (255, 255, 255)
@@ -37,225 +51,261 @@ GRAY = (180, 180, 180)
 
 
 # --- Initialize Pygame ---
+# small mixer buffer so hit sounds are not late, raise mixer_buffer in
+# calibration.json if the music crackles on this cabinet
+pre_init(load_setting("mixer_buffer", MIXER_BUFFER))
 pygame.init()
 try:
     pygame.mixer.init()
 except Exception as e:
     print("Warning: audio init failed:", e)
+sounds = HitSounds()
+hit_sounds = bool(load_setting("hit_sounds", 1))
+assist_ticks = bool(load_setting("assist_ticks", 0))   # T in the menu
 screen = pygame.display.set_mode((WIDTH, HEIGHT))
 pygame.display.set_caption("2-Button Rhythm Game")
 clock = pygame.time.Clock()
-
-# --- Game Variables ---
-squares = []
-score = 0
-hold_points_acc = 0.0
-judgment = ""
-judgment_timer = 0
-key_pressed = {pygame.K_LEFT: False, pygame.K_RIGHT: False}
-button_pressed = {LEFT_PIN: False, RIGHT_PIN: False}
-hold_frames = 0  # add this at top with other globals
-
-
-# Hit zones
-hit_zones = [
-    (WIDTH//4 - SQUARE_SIZE//2, HIT_ZONE_Y - SQUARE_SIZE//2),
-    (3*WIDTH//4 - SQUARE_SIZE//2, HIT_ZONE_Y - SQUARE_SIZE//2)
-]
+song_clock = SongClock(pygame.mixer.music.get_pos, load_offset())
+text = TextCache()
 
 travel_distance = HIT_ZONE_Y - (-SQUARE_SIZE)
-travel_time_ms = (travel_distance / SPEED) * (1000 / FPS)
+travel_time_ms = travel_distance / SPEED
+# missed notes keep falling until the end of their tail is off the screen
+linger_ms = (HEIGHT - HIT_ZONE_Y) / SPEED
+
+# --- Game Variables ---
+# player's scroll speed multiplier (↑ / ↓ in the menu), charts can add their own changes
+engine = Engine(2, travel_time_ms, linger_ms, clamp_multiplier(load_setting("scroll_speed", 1.0)))
+# per phase frame times, overlay on F3, saved to profiles/ on exit
+profiler = FrameProfiler(["wait", "events", "input", "spawn", "update", "draw", "flip"])
+PROFILE_RECT = (WIDTH - OVERLAY_SIZE[0], 40) + OVERLAY_SIZE
+# keys, GPIO buttons and joysticks, lanes follow the level's layout
+controls = Controls(Layout(), buttons, load_setting("joystick_deadzone", DEADZONE))
+
+
+def apply_layout(new_layout):
+    # Lane count, keys and colours come with each level (layout.py); the hit
+    # zones and the renderer's atlas are rebuilt to match.
+    global layout, renderer
+    layout = new_layout
+    controls.set_layout(layout)
+    size = layout.square_size(WIDTH, SQUARE_SIZE)
+    renderer = Renderer(screen, layout.hit_zones(WIDTH, HIT_ZONE_Y, size), size, SPEED, layout.colors, GRAY, GREEN,
+                        {msg: text.render("judgment", msg, YELLOW) for _, msg, _ in JUDGMENTS})
+    # HUD text areas, redrawn every frame while playing: score and practice lines, FPS
+    renderer.add_static((0, 0, WIDTH - 80, 90))
+    renderer.add_static((WIDTH - 80, 0, 80, 40))
+    if profiler.visible:
+        renderer.add_static(PROFILE_RECT)
+
+apply_layout(Layout())
 
 # --- Menu / Level Loading ---
 SONGS_DIR = Path("songs")
 levels = []
 selected_level = 0
 
+level_index = LevelIndex(SONGS_DIR)
+# the highlighted level's chart is preloaded; a song is decoded to WAV in the
+# background after its first play, or all up front with predecode_audio
+assets = AssetCache(predecode=bool(load_setting("predecode_audio", 0)))
+# finished plays, their judgments and replays; written in the background
+scores = ScoreStore(player=load_setting("player", "player", kind=str))
+
 def scan_levels():
     global levels, selected_level
-    levels = []
-    if not SONGS_DIR.exists():
-        SONGS_DIR.mkdir()
-    for folder in sorted(SONGS_DIR.iterdir()):
-        if folder.is_dir():
-            level_json = folder / "level.json"
-            chart_json = folder / "chart.json"
-            if level_json.exists() and chart_json.exists():
-                try:
-                    meta = json.loads(level_json.read_text(encoding="utf-8"))
-                    chart = json.loads(chart_json.read_text(encoding="utf-8")).get("notes", [])
-                    audio_path = None
-                    if "audio" in meta:
-                        candidate = folder / meta["audio"]
-                        if candidate.exists():
-                            audio_path = candidate
-                    if audio_path is None:
-                        for ext in (".mp3", ".ogg", ".wav"):
-                            found = list(folder.glob(f"*{ext}"))
-                            if found:
-                                audio_path = found[0]
-                                break
-                    if audio_path is None:
-                        continue
-                    meta["audio_path"] = str(audio_path)
-                    levels.append({"folder": folder, "meta": meta, "chart": chart})
-                except Exception as e:
-                    print("Error reading level:", folder, e)
+    # Only folders that changed since the last scan are re-read, charts are
+    # parsed when a level is started.
+    levels = level_index.scan()
     # Always add "New Level" as a pseudo entry
-    levels.append({"folder": None, "meta": {"name": "[New Level]"}, "chart": []})
+    levels.append({"folder": None, "meta": {"name": "[New Level]"}})
     if levels:
         selected_level = max(0, min(selected_level, len(levels)-1))
     else:
         selected_level = 0
+    assets.warm(levels)
+    assets.preload(levels[selected_level])
+
+def update_levels(names):
+    global levels, selected_level
+    # Only the folders the watcher reported are re-read; the selection stays
+    # on the same level.
+    entries = level_index.update(names)
+    selected = levels[selected_level]['folder']
+    by_name = {lev['folder'].name: lev for lev in levels if lev['folder'] is not None}
+    for name, entry in entries.items():
+        if entry is None:
+            by_name.pop(name, None)
+        else:
+            by_name[name] = entry
+    order = sorted(by_name)
+    levels = [by_name[name] for name in order] + [levels[-1]]   # "New Level" stays last
+    if selected is None:
+        selected_level = len(levels) - 1
+    elif selected.name in by_name:
+        selected_level = order.index(selected.name)
+    else:
+        selected_level = min(selected_level, len(levels) - 1)
+    assets.warm([entry for entry in entries.values() if entry is not None])
+    assets.preload(levels[selected_level])
 
 scan_levels()
+# charts copied onto the cabinet show up without pressing R
+song_watcher = SongWatcher(SONGS_DIR)
 
 # --- State ---
 state = "menu"  # menu, playing, results
-note_index = 0
-song_start_time = None
 current_level = None
+current_chart = None
 song_length_ms = 0
-perfect_possible = 0
 final_score = 0
 final_perfect = 0
+previous_best = None   # personal best before the play on the results screen
 level_end_trigger = None  # <-- new
 
-# --- Helper Functions ---
-def draw_hit_zones():
-    for x, y in hit_zones:
-        pygame.draw.rect(screen, GREEN, (x, y, SQUARE_SIZE, SQUARE_SIZE), 3)
-
-def calculate_score(distance):
-    max_score = 100
-    if distance < 20:
-        return max_score, "Perfect"
-    elif distance < 35:
-        return int(max_score * 0.7), "Good"
-    elif distance < 50:
-        return int(max_score * 0.4), "Near"
-    else:
-        return 0, "Miss"
+# Practice mode: seek anywhere and loop an A-B section, nothing is saved
+practice = False
+loop_a = None
+loop_b = None
+pass_start = 0.0       # earliest note time the current practice pass can score
+last_pass = None       # accuracy % of the previous pass through the loop
 
+# --- Helper Functions ---
 def reset_play_state():
-    global squares, score, judgment, judgment_timer, key_pressed, note_index, song_start_time, perfect_possible, hold_points_acc, level_end_trigger
-    squares = []
-    score = 0
-    hold_points_acc = 0.0
-    judgment = ""
-    judgment_timer = 0
-    key_pressed = {pygame.K_LEFT: False, pygame.K_RIGHT: False}
-    note_index = 0
-    song_start_time = None
-    perfect_possible = 0
+    global level_end_trigger
     level_end_trigger = None
 
 
-def handle_input(song_time, dt):
-    global score, hold_frames, judgment, judgment_timer
-    keys = pygame.key.get_pressed()
-    for side, key in enumerate([pygame.K_LEFT, pygame.K_RIGHT]):
-        if keys[key]:
-            if not key_pressed[key]:
-                key_pressed[key] = True
-                # Try to hit head
-                closest_sq = None
-                min_distance = float('inf')
-                for sq in squares:
-                    if sq['side'] == side and not sq.get("hit_start", False):
-                        distance = abs(sq['y'] + SQUARE_SIZE//2 - HIT_ZONE_Y)
-                        if distance < min_distance and distance < HIT_DISTANCE_THRESHOLD:
-                            min_distance = distance
-                            closest_sq = sq
-                if closest_sq:
-                    pts, msg = calculate_score(min_distance)
-                    score += pts
-                    judgment = msg
-                    judgment_timer = pygame.time.get_ticks()
-                    if closest_sq.get("duration", 0) > 0:
-                        closest_sq["hit_start"] = True
-                        head_y_at_perfect_end = HIT_ZONE_Y + 20
-                        frames_to_perfect_end = max((head_y_at_perfect_end - closest_sq['y']) / SPEED, 0)
-                        closest_sq["start_time"] = song_time + frames_to_perfect_end * (1000 / FPS)
-                    else:
-                        squares.remove(closest_sq)
-            # Holding long notes (inside handle_input, for the given side)
-            for sq in squares:
-                if sq['side'] == side and sq.get("duration", 0) > 0 and sq.get("hit_start", False):
-                    if song_time >= sq.get("start_time", 0) and song_time <= sq["end_time"]:
-                        sq["hold_frames"] += 1
-                        if sq["hold_frames"] >= 2:
-                            score += 5
-                            sq["hold_frames"] = 0
-
-
-        else:
-            key_pressed[key] = False
-            
-    for side, pin in enumerate([LEFT_PIN, RIGHT_PIN]):
-        pressed = not GPIO.input(pin)
+def handle_input(song_time):
+    # Every input device comes through controls with its own timestamps,
+    # apply each edge at the moment it happened, not at this frame.
+    for t, lane, pressed in controls.song_events(song_time):
         if pressed:
-            if not button_pressed[pin]:
-                button_pressed[pin] = True
-                closest_sq = None
-                min_distance = float('inf')
-
-                for sq in squares:
-                    if sq['side'] == side:
-                        distance = abs(sq['y'] + SQUARE_SIZE//2 - HIT_ZONE_Y)
-                        if distance < min_distance and distance < 100:
-                            min_distance = distance
-                            closest_sq = sq
-
-                if closest_sq:
-                    pts, msg = calculate_score(min_distance)
-                    squares.remove(closest_sq)
-                    score += pts
-                    judgment = msg
-                    judgment_timer = pygame.time.get_ticks()
+            result = engine.press(lane, t)
+            # the sound goes out now, before this frame is even drawn
+            if result is not None and hit_sounds:
+                sounds.play(result[1].lower())
         else:
-            button_pressed[pin] = False
+            engine.release(lane, t)
+
+
+def start_ticks(t):
+    if assist_ticks:
+        sounds.start_ticks(current_chart.times, t)
+    else:
+        sounds.stop_ticks()
 
-def start_level(level):
-    global state, current_level, song_start_time, song_length_ms, note_index, perfect_possible
+def start_level(level, practice_mode=False):
+    global state, current_level, current_chart, song_length_ms, practice, loop_a, loop_b, pass_start, last_pass
     reset_play_state()
+    practice = practice_mode
+    loop_a = loop_b = None
+    pass_start = 0.0
+    last_pass = None
     current_level = level
-    note_index = 0
-    song_start_time = None
+    # the chart was parsed while the level was highlighted in the menu
+    prepared = assets.get(level)
+    if prepared['error'] is not None:
+        print("Error reading chart:", level['folder'], prepared['error'])
+        return
+    current_chart = prepared['chart']
+    new_layout = layout_for(level['meta'], current_chart)
+    if len(current_chart) and max(current_chart.sides) >= new_layout.lanes:
+        print("Error reading chart:", level['folder'], f"more than {MAX_LANES} lanes")
+        return
+    apply_layout(new_layout)
+    engine.load(current_chart, Judge(windows_for(level['meta'])), layout.lanes)
     song_length_ms = level['meta'].get('length_ms', 0)
-    
-    perfect_possible = 0
-    for n in level['chart']:
-        if 'duration' in n and n['duration'] > 0:
-            duration_sec = n['duration'] / 1000.0
-            hold_frames = int(duration_sec * FPS)
-            body = (hold_frames // 2) * 5
-            perfect_possible += 100 + body
-        else:
-            perfect_possible += 100
-
-
-
 
     try:
         pygame.mixer.music.stop()
     except:
         pass
     try:
-        pygame.mixer.music.load(level['meta']['audio_path'])
+        load_music(level['meta']['audio_path'])
         pygame.mixer.music.play()
     except Exception as e:
         print("Audio play error:", e)
-    song_start_time = pygame.time.get_ticks()
+    start_ticks(0.0)
+    song_clock.start()
     state = "playing"
 
 
+def song_end_ms():
+    return max(song_length_ms, current_chart.end_time() if current_chart is not None else 0)
+
+
+def seek_to(t):
+    # Practice: restart the song and the engine at song time t (clamped to
+    # the song). The chart is not reloaded, only the notes on screen at t
+    # are rebuilt.
+    global pass_start
+    t = max(0.0, min(t, song_end_ms()))
+    reset_play_state()
+    engine.seek(t)
+    # keys held across the jump only play again once pressed again
+    controls.reset()
+    # seek() keeps notes back to t - miss playable, the pass counts them too
+    pass_start = t - engine.judge.miss
+    try:
+        pygame.mixer.music.play(start=t / 1000.0)
+    except Exception as e:
+        print("Audio play error:", e)
+    start_ticks(t)
+    song_clock.start(t)
+
+
+def loop_restart():
+    # Back to A (or the song start), early enough that the first note of
+    # the section falls in from the top of the screen.
+    global last_pass
+    if loop_b is not None:
+        possible = engine.perfect_between(pass_start, loop_b)
+        last_pass = engine.score / possible * 100.0 if possible > 0 else None
+    seek_to(engine.scroll.time_at(engine.scroll.position(loop_a) - travel_time_ms) if loop_a else 0.0)
+
+
+def handle_practice_key(key, song_time):
+    # , / .  seek back / forward     0-9  jump to 0% .. 90% of the song
+    # A / B  set loop start / end    C    clear loop    Backspace  restart
+    global state, loop_a, loop_b
+    if key == pygame.K_ESCAPE:
+        try: pygame.mixer.music.stop()
+        except: pass
+        sounds.stop_ticks()
+        assets.decode(current_level)
+        state = "menu"
+    elif key == pygame.K_COMMA:
+        seek_to(song_time - SEEK_STEP_MS)
+    elif key == pygame.K_PERIOD:
+        seek_to(song_time + SEEK_STEP_MS)
+    elif pygame.K_0 <= key <= pygame.K_9:
+        seek_to(song_end_ms() * (key - pygame.K_0) / 10)
+    elif key == pygame.K_a:
+        loop_a = max(0.0, song_time)
+        if loop_b is not None and loop_b <= loop_a:
+            loop_b = None
+    elif key == pygame.K_b:
+        if song_time > (loop_a or 0.0):
+            loop_b = song_time
+            loop_restart()
+    elif key == pygame.K_c:
+        loop_a = loop_b = None
+    elif key == pygame.K_BACKSPACE:
+        loop_restart()
+
+
 def end_level_and_show_results():
-    global state, final_score, final_perfect
+    global state, final_score, final_perfect, previous_best
     try: pygame.mixer.music.stop()
     except: pass
-    final_score = int(score)
-    final_perfect = int(perfect_possible)
+    sounds.stop_ticks()
+    assets.decode(current_level)
+    final_score = int(engine.score)
+    final_perfect = int(engine.perfect_possible)
+    level = current_level['folder'].name
+    previous_best = scores.best(level)
+    scores.record(level, current_chart, engine)
     state = "results"
 
 def create_new_level():
@@ -289,12 +339,8 @@ def create_new_level():
     dest_song = folder / song_file
     shutil.copy(song_path, dest_song)
 
-    # Get length in ms
-    try:
-        snd = pygame.mixer.Sound(str(dest_song))
-        length_ms = int(snd.get_length() * 1000)
-    except:
-        length_ms = 0
+    # Get length in ms (from the file header, the song is not decoded here)
+    length_ms = audio_duration_ms(dest_song)
 
     # Write metadata
     meta = {
@@ -309,188 +355,192 @@ def create_new_level():
     (folder / "chart.json").write_text(json.dumps({"notes":[]}, indent=2), encoding="utf-8")
 
     print(f"Created new level at {folder}")
+    return folder.name
 
 
 # --- Main Loop ---
 running = True
 while running:
+    profiler.start()
     dt = clock.tick(FPS)
-    screen.fill(BLACK)
-    now = pygame.time.get_ticks()
+    profiler.mark("wait")
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
             running = False
+        if controls.handle(event, play=state == "playing"):
+            continue
+        if event.type == pygame.KEYDOWN and event.key == PROFILE_KEY:
+            profiler.toggle()
+            if profiler.visible:
+                renderer.add_static(PROFILE_RECT)
+            else:
+                renderer.remove_static(PROFILE_RECT)
+        if state == "playing" and practice and event.type == pygame.KEYDOWN:
+            handle_practice_key(event.key, song_clock.time())
         if state == "menu" and event.type == pygame.KEYDOWN:
             if event.key == pygame.K_RIGHT:
-                if levels: selected_level = (selected_level + 1) % len(levels)
+                if levels:
+                    selected_level = (selected_level + 1) % len(levels)
+                    assets.preload(levels[selected_level])
             elif event.key == pygame.K_LEFT:
-                if levels: selected_level = (selected_level - 1) % len(levels)
+                if levels:
+                    selected_level = (selected_level - 1) % len(levels)
+                    assets.preload(levels[selected_level])
             elif event.key in (pygame.K_RETURN, pygame.K_KP_ENTER):
                 if levels:
                     if levels[selected_level]['meta']['name'] == "[New Level]":
-                        create_new_level()
-                        scan_levels()
+                        created = create_new_level()
+                        if created:
+                            update_levels([created])
                     else:
                         start_level(levels[selected_level])
+            elif event.key == pygame.K_p:
+                if levels and levels[selected_level]['folder'] is not None:
+                    start_level(levels[selected_level], practice_mode=True)
             elif event.key == pygame.K_r: scan_levels()
+            elif event.key in (pygame.K_UP, pygame.K_DOWN):
+                step = MULTIPLIER_STEP if event.key == pygame.K_UP else -MULTIPLIER_STEP
+                engine.speed = clamp_multiplier(engine.speed + step)
+                save_setting("scroll_speed", engine.speed)
+            elif event.key in (pygame.K_LEFTBRACKET, pygame.K_RIGHTBRACKET):
+                # audio/visual calibration for this cabinet, saved immediately
+                step = OFFSET_STEP if event.key == pygame.K_RIGHTBRACKET else -OFFSET_STEP
+                song_clock.offset_ms += step
+                save_offset(song_clock.offset_ms)
+            elif event.key == pygame.K_t:
+                assist_ticks = not assist_ticks
+                save_setting("assist_ticks", int(assist_ticks))
         elif state == "results" and event.type == pygame.KEYDOWN:
             if event.key in (pygame.K_RETURN, pygame.K_ESCAPE):
-                scan_levels()
                 state = "menu"
 
+    profiler.mark("events")
+    if state == "playing":
+        handle_input(song_clock.time())
+        sounds.update()
+    else:
+        controls.drain()   # nothing plays outside a level
+        # folders are never re-read mid-song, changes wait for the menu
+        changed = song_watcher.changed()
+        if changed:
+            update_levels(changed)
+    profiler.mark("input")
+
+    # The play field only redraws what moved (see renderer.py), every other
+    # screen is cleared and flipped whole.
+    if state == "playing":
+        renderer.begin_frame()
+    else:
+        screen.fill(BLACK)
+    profiler.mark("draw")
+
     # --- MENU ---
     if state == "menu":
-        title_font = pygame.font.SysFont(None, 48)
-        screen.blit(title_font.render("Rhythm Game", True, WHITE), (WIDTH//2 - 120, 40))
-        small = pygame.font.SysFont(None, 28)
+        text.blit(screen, "title", "Rhythm Game", WHITE, (WIDTH//2 - 120, 40))
         if not levels:
-            info = small.render("No levels found in 'songs/' folder.", True, YELLOW)
-            screen.blit(info, (20, 120))
+            text.blit(screen, "small", "No levels found in 'songs/' folder.", YELLOW, (20, 120))
         else:
             lev = levels[selected_level]
             meta = lev['meta']
             if meta.get("name") == "[New Level]":
                 # Show only "Add Level"
-                big = pygame.font.SysFont(None, 48)
-                text = big.render("Add Level", True, YELLOW)
-                screen.blit(text, (WIDTH//2 - text.get_width()//2, HEIGHT//2 - text.get_height()//2))
+                label = text.render("big", "Add Level", YELLOW)
+                screen.blit(label, (WIDTH//2 - label.get_width()//2, HEIGHT//2 - label.get_height()//2))
             else:
-                screen.blit(small.render(f"Name: {meta.get('name','?')}", True, WHITE), (20,140))
-                screen.blit(small.render(f"Difficulty: {meta.get('difficulty','?')}", True, WHITE), (20,170))
-                screen.blit(small.render(f"Length: {meta.get('length_ms',0)//1000}s", True, WHITE), (20,200))
+                text.blit(screen, "small", f"Name: {meta.get('name','?')}", WHITE, (20,140))
+                text.blit(screen, "small", f"Difficulty: {meta.get('difficulty','?')}   Lanes: {lev['lanes']}", WHITE, (20,170))
+                text.blit(screen, "small", f"Length: {meta.get('length_ms',0)//1000}s  Notes: {lev['notes']} ({lev['density']:.1f}/s)", WHITE, (20,200))
                 if lev['folder']:
-                    screen.blit(small.render(f"Folder: {lev['folder'].name}", True, GRAY), (20,230))
-                tip = small.render("Use ← / → to switch levels. Enter to play. Press R to refresh.", True, YELLOW)
-                screen.blit(tip, (20, HEIGHT - 40))
-                # chart preview
+                    best = scores.best(lev['folder'].name)
+                    best = f"   Best: {best[0]:.0f} ({best[1]:.1f}%)" if best else ""
+                    text.blit(screen, "small", f"Folder: {lev['folder'].name}{best}", GRAY, (20,230))
+                text.blit(screen, "small", "Use ← / → to switch levels. Enter to play. Press R to refresh.", YELLOW, (20, HEIGHT - 40))
+                text.blit(screen, "small", f"A/V offset: {song_clock.offset_ms:+.0f} ms  ([ / ])   Speed: x{engine.speed:.2f}  (↑ / ↓)", GRAY, (20, HEIGHT - 70))
+                text.blit(screen, "small", "P: practice (seek , . 0-9, loop A / B, C clears)", GRAY, (20, HEIGHT - 100))
+                text.blit(screen, "small", f"T: assist ticks {'on' if assist_ticks else 'off'}", GRAY, (20, HEIGHT - 130))
+                # chart preview: whole song, rendered once and then just blitted
                 preview_top = 260
                 preview_left = 40
                 preview_w = WIDTH - 80
                 preview_h = 200
-                pygame.draw.rect(screen, (40,40,40), (preview_left, preview_top, preview_w, preview_h))
-                chart = lev['chart']
-                length_ms = meta.get('length_ms', 60000)
-                if length_ms > 0:
-                    for n in chart[:200]:
-                        t = n['time']/max(1,length_ms)
-                        x = preview_left + int(t*preview_w)
-                        y = preview_top + (preview_h//4 if n['side']==0 else 3*preview_h//4)
-                        color = RED if n['side']==0 else BLUE
-                        if 'duration' in n and n['duration']>0:
-                            pygame.draw.line(screen, color, (x,y-5), (x,y+5), 4)
-                        else:
-                            pygame.draw.circle(screen, color, (x,y), 3)
+                screen.blit(get_preview(lev, (preview_w, preview_h), (meta.get("colors") or PALETTE)[:lev["lanes"]]), (preview_left, preview_top))
 
 
 
     # --- PLAYING ---
     elif state == "playing":
-        song_time = pygame.time.get_ticks() - song_start_time
-        # when spawning a note (replace your current spawning code inside the while loop)
-        while note_index < len(current_level['chart']) and current_level['chart'][note_index]["time"] - travel_time_ms <= song_time:
-            note = current_level['chart'][note_index]
-            side = note["side"]
-            color = RED if side == 0 else BLUE
-            x = hit_zones[side][0]
-            # compute spawn_time (song_time when this square should appear at top)
-            spawn_time = note["time"] - travel_time_ms
-            sq = {
-                'x': x,
-                'y': -SQUARE_SIZE,          # initial fallback, actual y computed from song_time
-                'color': color,
-                'side': side,
-                'note_time': note["time"],  # absolute ms in song when head should be at hit zone
-                'spawn_time': spawn_time,   # absolute ms in song when it was spawned
-                'hold_frames': 0
-            }
-            if "duration" in note:
-                sq["duration"] = note["duration"]            # ms
-                sq["end_time"] = note["time"] + note["duration"]
-                sq["hit_start"] = False
-            squares.append(sq)
-            note_index += 1
-
-        # Time-driven movement + drawing + removal
-        for sq in squares[:]:
-            # compute normalized progress from spawn -> hit zone
-            # clamp progress 0..1 for head movement
-            if travel_time_ms > 0:
-                progress = (song_time - sq['spawn_time']) / travel_time_ms
-            else:
-                progress = 1.0
-            # y = start_y + progress * travel_distance
-            sq_y = -SQUARE_SIZE + progress * travel_distance
-            sq['y'] = sq_y
-
-            # If this is a long note, draw tail that shows remaining hold length
-            if sq.get("duration", 0) > 0:
-                # tail_pixels corresponds to how many pixels the hold should occupy at given travel_time scale
-                tail_pixels = int((sq["duration"] / travel_time_ms) * travel_distance) if travel_time_ms>0 else 0
-                # tail top is sq_y - tail_pixels (the tail extends upward from head)
-                pygame.draw.rect(screen, GRAY, (sq['x'] + SQUARE_SIZE//4, sq_y - tail_pixels, SQUARE_SIZE//2, tail_pixels))
-            # draw head
-            pygame.draw.rect(screen, sq['color'], (sq['x'], sq_y, SQUARE_SIZE, SQUARE_SIZE))
-
-            # REMOVAL conditions based on song_time (timeline) and position:
-            #  - for non-long notes: if song_time > note_time + some grace -> remove (miss)
-            #  - for long notes not hit: if song_time > note_time + travel_time_ms + small_grace -> remove as missed (never hit)
-            #  - for long notes after hit_start: remove when song_time > end_time + travel_time_ms (tail passed)
-            # Use small grace to allow off-by-one/frame.
-            GRACE_MS = 30
-            if sq.get("duration",0) > 0:
-                # long note
-                if not sq.get("hit_start", False):
-                    # If song_time has passed the note's head time + travel_time (meaning head already should have reached and passed),
-                    # and the rendered head is below the hit zone by more than SQUARE_SIZE, treat as missed
-                    if song_time > sq['note_time'] + GRACE_MS and sq_y > HIT_ZONE_Y + SQUARE_SIZE:
-                        judgment = "Miss"
-                        judgment_timer = pygame.time.get_ticks()
-                        squares.remove(sq)
-                else:
-                    # already started holding; remove after the note's end_time + travel_time (tail fully passed)
-                    if song_time > sq['end_time'] + travel_time_ms + GRACE_MS:
-                        squares.remove(sq)
-            else:
-                # short note: if we've already passed the note_time + a bit and the head is below screen, mark miss and remove
-                if song_time > sq['note_time'] + GRACE_MS and sq_y > HEIGHT:
-                    pts, msg = calculate_score(abs(sq_y + SQUARE_SIZE - HIT_ZONE_Y))
-                    if pts == 0:
-                        judgment = "Miss"
-                        judgment_timer = pygame.time.get_ticks()
-                    squares.remove(sq)
-
-        handle_input(song_time, dt)
-        draw_hit_zones()
+        song_time = song_clock.time()
+        engine.spawn(song_time)
+        profiler.mark("spawn")
+        engine.update(song_time)
+        profiler.mark("update")
+
+        # Drawing only reads the engine: positions come straight from song_time,
+        # so the picture is right at whatever rate frames get drawn.
+        renderer.draw_notes(engine.lanes, song_time, engine.scroll)
+        renderer.draw_hit_zones(engine.down)
+        if engine.judgment_time is not None and song_time - engine.judgment_time < JUDGMENT_DISPLAY:
+            renderer.draw_judgment(engine.judgment, (WIDTH//2 - 60, HEIGHT-50))
+        renderer.flush()
 
         # --- End detection ---
-        if note_index >= len(current_level['chart']) and not squares:
+        if practice and loop_b is not None and song_time >= loop_b:
+            loop_restart()
+        elif engine.done:
             if level_end_trigger is None:
                 level_end_trigger = pygame.time.get_ticks()  # start countdown
             elif pygame.time.get_ticks() - level_end_trigger > 3000:  # 3s delay
-                end_level_and_show_results()
+                if practice:
+                    loop_restart()
+                else:
+                    end_level_and_show_results()
         
-        font = pygame.font.SysFont(None, 36)
-        screen.blit(font.render(f"Score: {int(score)}", True, WHITE), (10,10))
-        if pygame.time.get_ticks()-judgment_timer<JUDGMENT_DISPLAY:
-            jfont=pygame.font.SysFont(None,40)
-            screen.blit(jfont.render(judgment, True, YELLOW), (WIDTH//2 - 60, HEIGHT-50))
+        text.blit_number(screen, "score", "Score: ", int(engine.score), WHITE, (10,10))
+        if practice:
+            seconds = max(0, int(song_time)) // 1000
+            line = f"Practice {seconds//60}:{seconds%60:02d}"
+            if loop_a is not None:
+                line += f"  A {loop_a/1000:.1f}s"
+            if loop_b is not None:
+                line += f"  B {loop_b/1000:.1f}s"
+            text.blit(screen, "small", line, GRAY, (10, 40))
+            if last_pass is not None:
+                text.blit(screen, "small", f"Last pass: {last_pass:.1f}%", GREEN, (10, 65))
 
     # --- RESULTS ---
     elif state == "results":
-        title_font = pygame.font.SysFont(None,44)
-        small = pygame.font.SysFont(None,28)
-        screen.blit(title_font.render("Results", True, WHITE), (WIDTH//2-60,40))
-        screen.blit(small.render(f"Score: {final_score}", True, YELLOW), (40,120))
-        screen.blit(small.render(f"Perfect possible: {final_perfect}", True, WHITE), (40,160))
+        text.blit(screen, "results", "Results", WHITE, (WIDTH//2-60,40))
+        text.blit(screen, "small", f"Score: {final_score}", YELLOW, (40,120))
+        text.blit(screen, "small", f"Perfect possible: {final_perfect}", WHITE, (40,160))
         pct = (final_score/final_perfect*100.0) if final_perfect>0 else 0.0
-        screen.blit(small.render(f"Accuracy: {pct:.2f}%", True, GREEN), (40,200))
-        screen.blit(small.render("Press Enter or Esc to return to menu", True, GRAY), (40, HEIGHT-80))
+        text.blit(screen, "small", f"Accuracy: {pct:.2f}%", GREEN, (40,200))
+        if final_score > 0 and (previous_best is None or final_score > previous_best[0]):
+            text.blit(screen, "small", "New personal best!", YELLOW, (40,240))
+        elif previous_best is not None:
+            text.blit(screen, "small", f"Personal best: {previous_best[0]:.0f} ({previous_best[1]:.1f}%)", GRAY, (40,240))
+        # the store catches up within BATCH_MS, this play shows up then
+        for rank, (player, score, accuracy) in enumerate(scores.top(current_level['folder'].name), 1):
+            text.blit(screen, "small", f"{rank}. {score:8.0f}  {accuracy:6.2f}%  {player}", WHITE, (40,270 + 25*rank))
+        text.blit(screen, "small", "Press Enter or Esc to return to menu", GRAY, (40, HEIGHT-80))
 
     # --- FPS ---
-    fps_font = pygame.font.SysFont(None,18)
-    screen.blit(fps_font.render(f"FPS: {int(clock.get_fps())}", True, GRAY), (WIDTH-70,10))
-
-    pygame.display.flip()
+    text.blit_number(screen, "fps", "FPS: ", int(clock.get_fps()), GRAY, (WIDTH-70,10))
+    profiler.draw(screen, text, PROFILE_RECT[:2])
+    profiler.mark("draw")
 
+    if state == "playing":
+        renderer.end_frame()
+    else:
+        pygame.display.flip()
+        renderer.invalidate()
+    profiler.mark("flip")
+
+profile_path = profiler.dump()
+if profile_path:
+    print(f"Frame profile saved to {profile_path}")
+buttons.stop()
+assets.shutdown()
+scores.shutdown()
+song_watcher.stop()
 pygame.quit()
 sys.exit()
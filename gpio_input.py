@@ -0,0 +1,254 @@
+import threading
+import time
+import random
+from collections import deque
+
+try:
+    import RPi.GPIO as GPIO
+except (ImportError, RuntimeError):
+    GPIO = None
+
+
+# --- Config ---
+DEBOUNCE_MS = 5    # edges closer than this on one pin are treated as contact bounce
+POLL_HZ = 1000     # sampling rate of the fallback polling thread
+
+
+def now_ms():
+    return time.perf_counter() * 1000.0
+
+
+class PinEvent:
+    __slots__ = ("time", "lane", "pressed")
+
+    def __init__(self, time, lane, pressed):
+        self.time = time        # now_ms() timestamp of the edge
+        self.lane = lane        # index into the pin list
+        self.pressed = pressed  # True on press, False on release
+
+    def __repr__(self):
+        return f"PinEvent({self.time:.3f}, {self.lane}, {self.pressed})"
+
+
+class GpioInput:
+    # Buttons are wired active-low with pull-ups, lane i is pins[i].
+    # Edges are timestamped in the GPIO callback thread (or a >=1 kHz sampling
+    # thread when poll_hz is set) and appended to a deque; the main loop only
+    # drains it, so a press-and-release inside one frame is never lost.
+    def __init__(self, pins, debounce_ms=DEBOUNCE_MS, poll_hz=0, gpio=None):
+        self.pins = list(pins)
+        self.lane_of = {pin: lane for lane, pin in enumerate(self.pins)}
+        self.debounce_ms = debounce_ms
+        self.poll_hz = poll_hz
+        self.gpio = gpio if gpio is not None else GPIO
+        self.events = deque()   # append() / popleft() are atomic, no lock needed
+        # _push runs on the callback (or polling) thread and on the main
+        # thread's re-sync in drain(): its check-and-update of down and
+        # last_edge must not interleave, or one edge is queued twice or lost
+        self.lock = threading.Lock()
+        self.down = [False] * len(self.pins)
+        self.last_edge = [float("-inf")] * len(self.pins)
+        self.bounces = 0
+        self.running = False
+        self._thread = None
+
+    def start(self):
+        if self.gpio is None:
+            print("Warning: GPIO unavailable, buttons disabled")
+            return False
+        self.gpio.setmode(self.gpio.BCM)
+        for pin in self.pins:
+            self.gpio.setup(pin, self.gpio.IN, pull_up_down=self.gpio.PUD_UP)
+        for lane, pin in enumerate(self.pins):
+            self.down[lane] = not self.gpio.input(pin)
+        self.running = True
+        if self.poll_hz:
+            self._thread = threading.Thread(target=self._poll_loop, daemon=True)
+            self._thread.start()
+        else:
+            for pin in self.pins:
+                self.gpio.add_event_detect(pin, self.gpio.BOTH, callback=self._on_edge)
+        return True
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        else:
+            for pin in self.pins:
+                self.gpio.remove_event_detect(pin)
+
+    def now(self):
+        return now_ms()
+
+    def is_down(self, lane):
+        return self.down[lane]
+
+    def drain(self):
+        # Re-sync lanes whose final edge was swallowed by the debounce window,
+        # otherwise a bouncy release would leave the lane stuck down.
+        if self.running and self._thread is None:
+            t = now_ms()
+            for lane, pin in enumerate(self.pins):
+                if t - self.last_edge[lane] >= self.debounce_ms:
+                    pressed = not self.gpio.input(pin)
+                    if pressed != self.down[lane]:
+                        self._push(lane, pressed, t)
+        out = []
+        events = self.events
+        while events:
+            out.append(events.popleft())
+        return out
+
+    def _on_edge(self, pin):
+        t = now_ms()
+        self._push(self.lane_of[pin], not self.gpio.input(pin), t)
+
+    def _poll_loop(self):
+        period = 1.0 / self.poll_hz
+        next_tick = time.perf_counter()
+        while self.running:
+            t = now_ms()
+            for lane, pin in enumerate(self.pins):
+                pressed = not self.gpio.input(pin)
+                if pressed != self.down[lane]:
+                    self._push(lane, pressed, t)
+            next_tick += period
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.perf_counter()
+
+    def _push(self, lane, pressed, t):
+        with self.lock:
+            if pressed == self.down[lane]:
+                return
+            if t - self.last_edge[lane] < self.debounce_ms:
+                self.bounces += 1
+                return
+            self.last_edge[lane] = t
+            self.down[lane] = pressed
+            self.events.append(PinEvent(t, lane, pressed))
+
+
+# --- Fake pins (benchmarking without a Pi) ---
+class FakePins:
+    # Minimal stand-in for the RPi.GPIO calls GpioInput uses. set() drives a
+    # pin level and fires the edge callback from the calling thread, the same
+    # way RPi.GPIO fires callbacks from its own thread.
+    BCM = "BCM"
+    IN = "IN"
+    PUD_UP = "PUD_UP"
+    BOTH = "BOTH"
+
+    def __init__(self):
+        self.levels = {}
+        self.callbacks = {}
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, pin, direction, pull_up_down=None):
+        self.levels[pin] = 1
+
+    def input(self, pin):
+        return self.levels.get(pin, 1)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self.callbacks[pin] = callback
+
+    def remove_event_detect(self, pin):
+        self.callbacks.pop(pin, None)
+
+    def cleanup(self):
+        self.callbacks.clear()
+
+    def set(self, pin, level):
+        if self.levels.get(pin, 1) == level:
+            return
+        self.levels[pin] = level
+        callback = self.callbacks.get(pin)
+        if callback:
+            callback(pin)
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def run_benchmark(presses=300, frame_ms=1000 / 60, poll_hz=0, seed=1):
+    # Drive two fake pins with short taps (many shorter than a frame) and
+    # some contact bounce, drain once per frame like the game loop does and
+    # compare against sampling the pin level once per frame.
+    rng = random.Random(seed)
+    fake = FakePins()
+    pins = [23, 4]
+    buttons = GpioInput(pins, poll_hz=poll_hz, gpio=fake)
+    buttons.start()
+
+    pressed_at = []
+    done = threading.Event()
+
+    def presser():
+        for _ in range(presses):
+            lane = rng.randrange(len(pins))
+            time.sleep(rng.uniform(0.02, 0.06))
+            pressed_at.append((now_ms(), lane))
+            fake.set(pins[lane], 0)
+            for _ in range(rng.randrange(3)):  # bounce on the way down
+                time.sleep(0.0005)
+                fake.set(pins[lane], 1)
+                time.sleep(0.0005)
+                fake.set(pins[lane], 0)
+            time.sleep(rng.uniform(0.006, 0.03))
+            fake.set(pins[lane], 1)
+        done.set()
+
+    thread = threading.Thread(target=presser, daemon=True)
+    thread.start()
+
+    received = []
+    drain_delay = []
+    polled = 0
+    polled_down = [False] * len(pins)
+    while not done.is_set() or buttons.events:
+        time.sleep(frame_ms / 1000.0)
+        frame_time = now_ms()
+        for ev in buttons.drain():
+            if ev.pressed:
+                received.append(ev)
+                drain_delay.append(frame_time - ev.time)
+        for lane, pin in enumerate(pins):
+            down = not fake.input(pin)
+            if down and not polled_down[lane]:
+                polled += 1
+            polled_down[lane] = down
+    thread.join()
+    buttons.stop()
+
+    # Match each received press to the latest real press on its lane.
+    stamp_error = []
+    for ev in received:
+        real = [t for t, lane in pressed_at if lane == ev.lane and t <= ev.time]
+        if real:
+            stamp_error.append(ev.time - real[-1])
+
+    mode = f"poll {poll_hz} Hz" if poll_hz else "edge callbacks"
+    print(f"--- GPIO input benchmark ({mode}, {presses} presses) ---")
+    print(f"received presses:     {len(received)} (dropped {presses - len(received)})")
+    print(f"frame polling saw:    {polled} (dropped {presses - polled})")
+    print(f"bounces rejected:     {buttons.bounces}")
+    print(f"timestamp error ms:   p50 {percentile(stamp_error, 50):.3f}  p99 {percentile(stamp_error, 99):.3f}")
+    print(f"queue dwell ms:       p50 {percentile(drain_delay, 50):.3f}  p99 {percentile(drain_delay, 99):.3f}")
+
+
+if __name__ == "__main__":
+    run_benchmark()
+    run_benchmark(poll_hz=POLL_HZ)
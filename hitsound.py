@@ -0,0 +1,128 @@
+import math
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+
+import pygame
+
+
+# --- Config ---
+MIXER_RATE = 44100
+MIXER_BUFFER = 256       # frames (~6 ms); pygame's default 512 doubles the output latency
+HIT_CHANNELS = 4         # reserved for hit sounds, used round robin
+TICK_CHUNK_MS = 200      # assist ticks are mixed into chunks this long, queued back to back
+SOUNDS_DIR = Path("sounds")   # optional <name>.wav replacing a built-in sample
+# name -> (frequency Hz, length ms, volume) of the built-in samples
+SAMPLES = {
+    "perfect": (1760, 40, 0.5),
+    "good": (1320, 40, 0.45),
+    "near": (880, 50, 0.4),
+    "miss": (220, 70, 0.4),
+    "tick": (2000, 12, 0.6),
+}
+
+
+def pre_init(buffer=MIXER_BUFFER):
+    # Small mixer buffer for low output latency, must run before pygame.init().
+    pygame.mixer.pre_init(MIXER_RATE, -16, 2, int(buffer))
+
+
+def tone(rate, channels, freq, ms, volume):
+    # Exponentially decaying sine, 16-bit interleaved, as raw mixer bytes.
+    count = int(rate * ms / 1000)
+    samples = array("h")
+    for i in range(count):
+        value = int(32767 * volume * math.exp(-5.0 * i / count) * math.sin(2 * math.pi * freq * i / rate))
+        samples.extend([value] * channels)
+    return samples.tobytes()
+
+
+class HitSounds:
+    # Hit feedback and assist ticks on reserved mixer channels. Every sample
+    # is a Sound built once at startup, so a hit is a Channel.play() on the
+    # next reserved channel: nothing is loaded or allocated on the hot path
+    # and the music never loses a channel to it.
+    # Assist ticks click on the chart's note times. They are mixed ahead of
+    # time into TICK_CHUNK_MS chunks queued back to back on their own
+    # channel, so every click lands on its exact sample whatever the frame
+    # rate; update() keeps one chunk queued. They follow the audio clock
+    # like the music, the A/V offset does not apply.
+    def __init__(self, sounds_dir=SOUNDS_DIR, channels=HIT_CHANNELS):
+        self.enabled = False
+        self.tick_times = None
+        init = pygame.mixer.get_init()
+        if not init or init[1] != -16:
+            print("Warning: hit sounds need a 16-bit mixer, disabled")
+            return
+        self.rate, _, self.mixer_channels = init
+        self.raw = {}
+        for name, (freq, ms, volume) in SAMPLES.items():
+            path = Path(sounds_dir) / f"{name}.wav"
+            try:
+                self.raw[name] = pygame.mixer.Sound(str(path)).get_raw() if path.exists() else None
+            except pygame.error as e:
+                print("Warning: could not load hit sound:", path, e)
+                self.raw[name] = None
+            if self.raw[name] is None:
+                self.raw[name] = tone(self.rate, self.mixer_channels, freq, ms, volume)
+        self.sounds = {name: pygame.mixer.Sound(buffer=raw) for name, raw in self.raw.items()}
+        pygame.mixer.set_reserved(channels + 1)
+        self.channels = [pygame.mixer.Channel(i) for i in range(channels)]
+        self.tick_channel = pygame.mixer.Channel(channels)
+        self.next = 0
+        self.enabled = True
+
+    def play(self, name):
+        if not self.enabled:
+            return
+        sound = self.sounds.get(name)
+        if sound is None:
+            return
+        self.channels[self.next].play(sound)
+        self.next = (self.next + 1) % len(self.channels)
+
+    # --- Assist ticks ---
+    def start_ticks(self, times, t=0.0):
+        # Call right after the music starts (or seeks) at song time t.
+        # times: the chart's sorted note times in ms.
+        if not self.enabled:
+            return
+        self.tick_times = times
+        self.tick_start = t
+        self.tick_frame = 0
+        self.tick_channel.stop()
+        self.tick_channel.play(self._chunk())
+        self.tick_channel.queue(self._chunk())
+
+    def stop_ticks(self):
+        if self.tick_times is not None:
+            self.tick_times = None
+            self.tick_channel.stop()
+
+    def update(self):
+        # Once a frame: a frame is much shorter than a chunk, so the queue
+        # never runs dry.
+        if self.tick_times is not None and self.tick_channel.get_queue() is None:
+            self.tick_channel.queue(self._chunk())
+
+    def _chunk(self):
+        # The next TICK_CHUNK_MS of clicks. Chunks are whole frames counted
+        # from tick_start, so song time never drifts from the sample clock.
+        frames = self.rate * TICK_CHUNK_MS // 1000
+        width = 2 * self.mixer_channels
+        start_ms = self.tick_start + self.tick_frame * 1000.0 / self.rate
+        self.tick_frame += frames
+        buf = bytearray(frames * width)
+        tick = self.raw["tick"]
+        tick_frames = len(tick) // width
+        times = self.tick_times
+        i = bisect_left(times, start_ms - tick_frames * 1000.0 / self.rate)
+        end_ms = start_ms + TICK_CHUNK_MS
+        while i < len(times) and times[i] < end_ms:
+            at = int(round((times[i] - start_ms) * self.rate / 1000.0))
+            skip = max(0, -at)
+            stop = min(tick_frames, frames - at)
+            if stop > skip:
+                buf[(at + skip) * width:(at + stop) * width] = tick[skip * width:stop * width]
+            i += 1
+        return pygame.mixer.Sound(buffer=bytes(buf))
@@ -0,0 +1,61 @@
+# --- Timing windows ---
+# Milliseconds either side of a note's time. A press inside "miss" takes the
+# note for 0 points, a press outside it is ignored, and a note nobody pressed
+# is missed once song time passes note_time + miss.
+# "Medium" matches the old pixel thresholds (20 / 35 / 50 px, 70 px hit range)
+# at 8 px per frame and 60 FPS, so existing charts feel the same.
+DEFAULT_DIFFICULTY = "Medium"
+WINDOWS = {
+    "Easy":   {"perfect": 55, "good": 95, "near": 135, "miss": 180},
+    "Medium": {"perfect": 42, "good": 73, "near": 104, "miss": 146},
+    "Hard":   {"perfect": 30, "good": 55, "near": 80,  "miss": 115},
+}
+MAX_SCORE = 100
+JUDGMENTS = (
+    ("perfect", "Perfect", MAX_SCORE),
+    ("good", "Good", int(MAX_SCORE * 0.7)),
+    ("near", "Near", int(MAX_SCORE * 0.4)),
+    ("miss", "Miss", 0),
+)
+
+
+def windows_for(meta):
+    # level.json may pick a preset with "difficulty" and override any window
+    # with e.g. "windows": {"perfect": 35}; unknown difficulties use Medium.
+    # Anything unusable is skipped with a warning and keeps the preset value.
+    difficulty = str(meta.get("difficulty", DEFAULT_DIFFICULTY)).capitalize()
+    if difficulty not in WINDOWS:
+        difficulty = DEFAULT_DIFFICULTY
+    windows = dict(WINDOWS[difficulty])
+    overrides = meta.get("windows", {})
+    if not isinstance(overrides, dict):
+        print(f"Warning: bad timing windows {overrides!r} in level.json, using {difficulty}")
+        return windows
+    for name, value in overrides.items():
+        if name not in windows:
+            continue
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and 0 < value < float("inf"):
+            windows[name] = float(value)
+        else:
+            print(f"Warning: bad {name} window {value!r} in level.json, using {windows[name]} ms")
+    return windows
+
+
+class Judge:
+    def __init__(self, windows=None):
+        windows = windows or WINDOWS[DEFAULT_DIFFICULTY]
+        self.windows = windows
+        self.miss = windows["miss"]
+        self.table = [(windows[key], msg, pts) for key, msg, pts in JUDGMENTS]
+
+    def judge(self, offset):
+        # offset = press_time - note_time in ms, returns (points, message)
+        # or None when the press is too far from the note to count.
+        offset = abs(offset)
+        for limit, msg, pts in self.table:
+            if offset <= limit:
+                return pts, msg
+        return None
+
+    def expired(self, note_time, song_time):
+        return song_time > note_time + self.miss
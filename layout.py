@@ -0,0 +1,65 @@
+import pygame
+
+from levelindex import meta_lanes, DEFAULT_LANES
+
+
+# --- Config ---
+MAX_LANES = 8
+LANE_GAP = 6    # px between hit zones when lanes have to shrink to fit
+# Keys per lane count, pygame key names. 2 is the cabinet, 4 the joystick
+# directions, 6 the wip/chartscript.py layout (Z, X, then the arrows).
+DEFAULT_KEYS = {
+    2: ["left", "right"],
+    4: ["left", "down", "up", "right"],
+    6: ["z", "x", "up", "down", "left", "right"],
+}
+# any other lane count; no practice mode keys (A, B, C, digits, comma, period)
+KEY_ROW = ["s", "d", "f", "g", "h", "j", "k", "l"]
+PALETTE = [(255, 100, 100), (100, 100, 255), (255, 180, 80), (200, 120, 255),
+           (100, 220, 220), (255, 130, 200), (180, 220, 100), (230, 230, 230)]
+
+
+class Layout:
+    # Lane count, keys and colours of a level, from level.json:
+    #   "lanes":  number of lanes (the chart's highest side wins if larger)
+    #   "keys":   optional pygame key names, one per lane
+    #   "colors": optional [r, g, b] per lane
+    # Anything missing or unusable falls back to the defaults above.
+    def __init__(self, lanes=DEFAULT_LANES, keys=None, colors=None):
+        self.lanes = max(1, min(int(lanes), MAX_LANES))
+        self.keys = self._keys(keys)
+        if colors and len(colors) >= self.lanes:
+            self.colors = [tuple(c) for c in colors[:self.lanes]]
+        else:
+            self.colors = [PALETTE[i % len(PALETTE)] for i in range(self.lanes)]
+        self.lane_of_key = {key: lane for lane, key in enumerate(self.keys)}
+
+    def _keys(self, names):
+        if names:
+            try:
+                if len(names) < self.lanes:
+                    raise ValueError("fewer keys than lanes")
+                return [pygame.key.key_code(name) for name in names[:self.lanes]]
+            except (ValueError, TypeError) as e:
+                print("Warning: bad lane keys in level.json, using defaults:", e)
+        names = DEFAULT_KEYS.get(self.lanes, KEY_ROW[:self.lanes])
+        return [pygame.key.key_code(name) for name in names]
+
+    def square_size(self, width, size):
+        # hit zones keep their size until the lanes get narrower than them
+        return max(8, min(size, width // self.lanes - LANE_GAP))
+
+    def hit_zones(self, width, zone_y, size):
+        # top-left of each lane's zone, lanes evenly spread over the width
+        # (2 lanes land on width/4 and 3*width/4 as always)
+        return [(int((lane + 0.5) * width / self.lanes) - size // 2, zone_y - size // 2)
+                for lane in range(self.lanes)]
+
+
+def layout_for(meta, chart=None):
+    lanes = meta_lanes(meta)
+    if chart is not None and len(chart):
+        lanes = max(lanes, max(chart.sides) + 1)
+    if lanes > MAX_LANES:
+        print(f"Warning: {lanes} lanes, only {MAX_LANES} are playable")
+    return Layout(lanes, meta.get("keys"), meta.get("colors"))
@@ -0,0 +1,193 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+
+# --- Config ---
+INDEX_NAME = ".index.json"
+INDEX_VERSION = 4
+AUDIO_EXTS = (".mp3", ".ogg", ".wav")
+POOL_THRESHOLD = 8    # use the worker pool when at least this many folders changed
+WORKERS = 4
+DEFAULT_LANES = 2
+
+
+def load_chart(folder):
+    # Full chart, only parsed when a level is actually started.
+    chart_json = Path(folder) / "chart.json"
+    return json.loads(chart_json.read_text(encoding="utf-8")).get("notes", [])
+
+
+def folder_signature(folder):
+    # Adding/removing files (audio) touches the folder mtime, editing the
+    # json files only touches theirs, so all three are checked.
+    sig = [folder.stat().st_mtime_ns]
+    for name in ("level.json", "chart.json"):
+        st = (folder / name).stat()
+        sig += [st.st_mtime_ns, st.st_size]
+    return sig
+
+
+def find_audio(folder, meta):
+    if "audio" in meta:
+        candidate = folder / meta["audio"]
+        if candidate.exists():
+            return candidate
+    for ext in AUDIO_EXTS:
+        # dot files are caches (.audio.wav), not the song
+        found = sorted(p for p in folder.glob(f"*{ext}") if not p.name.startswith("."))
+        if found:
+            return found[0]
+    return None
+
+
+def meta_lanes(meta, folder=None):
+    # "lanes" from level.json, DEFAULT_LANES when it is missing or not a
+    # positive whole number
+    lanes = meta.get("lanes", DEFAULT_LANES)
+    if isinstance(lanes, (int, float)) and not isinstance(lanes, bool) and lanes >= 1 and lanes == int(lanes):
+        return int(lanes)
+    print(f"Warning: bad lane count {lanes!r} in {folder or 'level.json'}, using {DEFAULT_LANES}")
+    return DEFAULT_LANES
+
+
+def summarize_chart(notes, length_ms):
+    end = max([n["time"] + n.get("duration", 0) for n in notes], default=0)
+    span = max(length_ms or end, 1)
+    return {
+        "notes": len(notes),
+        "long_notes": sum(1 for n in notes if n.get("duration", 0) > 0),
+        "lanes": max([n["side"] + 1 for n in notes], default=0),
+        "density": round(len(notes) / (span / 1000.0), 3),
+    }
+
+
+def index_folder(folder):
+    # Parses one song folder into an index record. Folders without audio are
+    # remembered as skipped so they are not re-read until they change; None
+    # means the folder could not be read and is retried next scan.
+    try:
+        sig = folder_signature(folder)
+        meta = json.loads((folder / "level.json").read_text(encoding="utf-8"))
+        if not isinstance(meta, dict):
+            raise ValueError("level.json is not an object")
+        if "lanes" in meta:
+            meta["lanes"] = meta_lanes(meta, folder)
+        audio_path = find_audio(folder, meta)
+        if audio_path is None:
+            return {"sig": sig, "skip": True}
+        record = {"sig": sig, "meta": meta, "audio": audio_path.name}
+        record.update(summarize_chart(load_chart(folder), meta.get("length_ms", 0)))
+        return record
+    except Exception as e:
+        print("Error reading level:", folder, e)
+        return None
+
+
+def is_level_folder(folder):
+    return folder.is_dir() and (folder / "level.json").exists() and (folder / "chart.json").exists()
+
+
+def is_fresh(record, folder):
+    try:
+        return record is not None and record["sig"] == folder_signature(folder)
+    except OSError:
+        return False
+
+
+class LevelIndex:
+    # On-disk manifest of every song folder, keyed by folder name and
+    # invalidated by folder_signature(). scan() only parses folders that
+    # changed since the last scan and never reads a chart's notes otherwise;
+    # update() looks at just the folders a songwatch.SongWatcher reported.
+    def __init__(self, songs_dir, workers=WORKERS):
+        self.songs_dir = Path(songs_dir)
+        self.path = self.songs_dir / INDEX_NAME
+        self.workers = workers
+        self.records = self._load()
+
+    def _load(self):
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            if data.get("version") == INDEX_VERSION:
+                return data.get("levels", {})
+        except (OSError, ValueError):
+            pass
+        return {}
+
+    def _save(self):
+        tmp = self.path.with_suffix(".tmp")
+        try:
+            tmp.write_text(json.dumps({"version": INDEX_VERSION, "levels": self.records},
+                                      separators=(",", ":")), encoding="utf-8")
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print("Warning: could not save level index:", e)
+
+    def scan(self):
+        if not self.songs_dir.exists():
+            self.songs_dir.mkdir()
+        folders = {}
+        changed = []
+        for folder in self.songs_dir.iterdir():
+            if not is_level_folder(folder):
+                continue
+            folders[folder.name] = folder
+            if not is_fresh(self.records.get(folder.name), folder):
+                changed.append(folder)
+
+        dirty = bool(changed) or any(name not in folders for name in self.records)
+        if len(changed) >= POOL_THRESHOLD and self.workers > 1:
+            with ThreadPoolExecutor(self.workers) as pool:
+                results = list(pool.map(index_folder, changed))
+        else:
+            results = [index_folder(folder) for folder in changed]
+        for folder, record in zip(changed, results):
+            if record is None:
+                self.records.pop(folder.name, None)
+            else:
+                self.records[folder.name] = record
+        for name in list(self.records):
+            if name not in folders:
+                del self.records[name]
+        if dirty:
+            self._save()
+
+        return [self.entry(folders[name]) for name in sorted(self.records)
+                if not self.records[name].get("skip")]
+
+    def update(self, names):
+        # Re-reads only the named folders. Returns {name: menu entry, or None
+        # when the folder is gone or not a playable level (any more)}.
+        entries = {}
+        dirty = False
+        for name in names:
+            folder = self.songs_dir / name
+            record = self.records.get(name)
+            if not is_level_folder(folder):
+                record = None
+            elif not is_fresh(record, folder):
+                record = index_folder(folder)
+            if record is None:
+                dirty |= self.records.pop(name, None) is not None
+            elif record is not self.records.get(name):
+                self.records[name] = record
+                dirty = True
+            entries[name] = None if record is None or record.get("skip") else self.entry(folder)
+        if dirty:
+            self._save()
+        return entries
+
+    def entry(self, folder):
+        record = self.records[folder.name]
+        meta = dict(record["meta"])
+        meta["audio_path"] = str(folder / record["audio"])
+        return {
+            "folder": folder,
+            "meta": meta,
+            "notes": record["notes"],
+            "long_notes": record["long_notes"],
+            "density": record["density"],
+            "lanes": max(record["lanes"], meta.get("lanes", DEFAULT_LANES)),
+        }
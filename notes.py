@@ -0,0 +1,75 @@
+from collections import deque
+
+
+class Note:
+    # One on-screen note. Slots keep it small and attribute access fast on the Pi.
+    __slots__ = ("side", "note_time", "spawn_time", "duration", "end_time", "scored_until", "pos", "end_pos")
+
+    def __init__(self, side, note_time, spawn_time, duration=0, pos=None, end_pos=None):
+        self.side = side
+        self.note_time = note_time    # ms in song when the head reaches the hit zone
+        self.spawn_time = spawn_time  # ms in song when it appears at the top
+        self.duration = duration      # ms, 0 for tap notes
+        self.end_time = note_time + duration
+        self.scored_until = 0         # hold points are paid up to this song time
+        # scroll positions of head and tail end (scroll.py), the same as the
+        # times when the chart has no speed changes
+        self.pos = note_time if pos is None else pos
+        self.end_pos = self.end_time if end_pos is None else end_pos
+
+
+class LaneQueues:
+    # Per-lane FIFOs of spawned notes. Notes enter in chart order, so in each
+    # lane the next note to judge is always at the front of `pending`, and
+    # hits, misses and finished holds all leave from a front with popleft().
+    #   pending - not judged yet
+    #   holding - long notes whose head was hit, tail still scrolling
+    #   missed  - missed notes still falling off the screen
+    def __init__(self, lanes):
+        self.pending = [deque() for _ in range(lanes)]
+        self.holding = [deque() for _ in range(lanes)]
+        self.missed = [deque() for _ in range(lanes)]
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for group in (self.missed, self.holding, self.pending):
+            for queue in group:
+                yield from queue
+
+    def add(self, note):
+        self.pending[note.side].append(note)
+        self.count += 1
+
+    def next(self, side):
+        queue = self.pending[side]
+        return queue[0] if queue else None
+
+    def hit(self, side):
+        # Head of `side` was hit: tap notes are done, long notes start holding.
+        note = self.pending[side].popleft()
+        if note.duration > 0:
+            self.holding[side].append(note)
+        else:
+            self.count -= 1
+        return note
+
+    def drop(self, side):
+        # Head of `side` is gone for good (e.g. a press judged as Miss).
+        self.count -= 1
+        return self.pending[side].popleft()
+
+    def miss(self, side):
+        note = self.pending[side].popleft()
+        self.missed[side].append(note)
+        return note
+
+    def retire_missed(self, side):
+        self.count -= 1
+        return self.missed[side].popleft()
+
+    def retire_holding(self, side):
+        self.count -= 1
+        return self.holding[side].popleft()
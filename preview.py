@@ -0,0 +1,110 @@
+import json
+
+import pygame
+from levelindex import load_chart
+
+
+# --- Config ---
+PREVIEW_NAME = "preview.png"   # cached next to level.json
+PREVIEW_INFO = ".preview.json" # the chart.json and level.json it was drawn from
+BACKGROUND = (40, 40, 40)
+TICK_MIN, TICK_MAX = 6, 18     # tap tick height for 1 .. 3+ taps in a column
+
+
+def bin_chart(notes, length_ms, width, lanes):
+    # One pass over the chart: tap counts per pixel column, and how many ms of
+    # each column are covered by a hold, per lane.
+    end = max([n["time"] + n.get("duration", 0) for n in notes], default=0)
+    span = max(length_ms or end, 1)
+    col_ms = span / width
+    taps = [[0] * width for _ in range(lanes)]
+    holds = [[0.0] * width for _ in range(lanes)]
+    for n in notes:
+        side = n["side"]
+        start = n["time"]
+        duration = n.get("duration", 0)
+        if duration <= 0:
+            taps[side][min(width - 1, int(start / col_ms))] += 1
+            continue
+        stop = min(start + duration, span)
+        col = int(start / col_ms)
+        cover = holds[side]
+        while col < width and col * col_ms < stop:
+            left = max(start, col * col_ms)
+            right = min(stop, (col + 1) * col_ms)
+            cover[col] += right - left
+            col += 1
+    return taps, holds, col_ms
+
+
+def render_preview(notes, length_ms, size, colors):
+    width, height = size
+    lanes = max([n["side"] + 1 for n in notes] + [len(colors)])
+    taps, holds, col_ms = bin_chart(notes, length_ms, width, lanes)
+    surf = pygame.Surface(size)
+    surf.fill(BACKGROUND)
+    lane_h = height / lanes
+    for lane in range(lanes):
+        color = colors[lane % len(colors)]
+        y = int((lane + 0.5) * lane_h)
+        band = int(lane_h * 0.3)
+        # holds: heat band, brighter the more of the column is held
+        for x, covered in enumerate(holds[lane]):
+            if covered > 0:
+                k = min(1.0, covered / col_ms)
+                shade = tuple(int(bg + (c - bg) * (0.25 + 0.5 * k)) for bg, c in zip(BACKGROUND, color))
+                pygame.draw.line(surf, shade, (x, y - band), (x, y + band))
+        # taps: ticks on top, taller for busier columns
+        for x, count in enumerate(taps[lane]):
+            if count:
+                half = (TICK_MIN + (TICK_MAX - TICK_MIN) * (min(count, 3) - 1) // 2) // 2
+                pygame.draw.line(surf, color, (x, y - half), (x, y + half))
+    return surf
+
+
+def source_signature(folder):
+    # exact size and mtime of both sources: a copied-in chart may be older
+    # than the PNG it replaces
+    sig = []
+    for name in ("chart.json", "level.json"):
+        st = (folder / name).stat()
+        sig += [st.st_size, st.st_mtime_ns]
+    return sig
+
+
+def get_preview(level, size, colors):
+    # Cached on the level entry for this session and as a PNG on disk, so
+    # the menu only ever blits it. Rebuilt when chart.json or level.json is
+    # not exactly the one it was drawn from or the size changed.
+    surf = level.get("preview_surface")
+    if surf is not None:
+        return surf
+    folder = level["folder"]
+    png = folder / PREVIEW_NAME
+    info = folder / PREVIEW_INFO
+    sig = None
+    try:
+        sig = source_signature(folder)
+        if json.loads(info.read_text(encoding="utf-8")) == sig and png.exists():
+            surf = pygame.image.load(str(png))
+            if surf.get_size() != tuple(size):
+                surf = None
+            elif pygame.display.get_surface() is not None:
+                surf = surf.convert()
+    except (OSError, ValueError, pygame.error):
+        surf = None
+    if surf is None:
+        try:
+            notes = load_chart(folder)
+        except Exception as e:
+            print("Error reading chart:", folder, e)
+            notes = []
+        surf = render_preview(notes, level["meta"].get("length_ms", 0), size, colors)
+        try:
+            pygame.image.save(surf, str(png))
+            if sig is not None:
+                info.write_text(json.dumps(sig), encoding="utf-8")
+        except (OSError, pygame.error) as e:
+            print("Warning: could not save preview:", e)
+    level["preview_surface"] = surf
+    return surf
@@ -0,0 +1,194 @@
+import argparse
+import json
+import math
+import sys
+import time
+from collections import deque
+from pathlib import Path
+
+
+# --- Config ---
+HISTORY = 240            # frames kept for the overlay graph and its p50/p99
+BUCKETS_PER_OCTAVE = 8   # histogram resolution, buckets grow ~9% each
+BUCKETS = 17 * BUCKETS_PER_OCTAVE   # 1 us .. ~130 ms, longer lands in the last one
+FRAME_BUDGET_MS = 1000 / 60
+OVERLAY_SIZE = (190, 150)
+OVERLAY_REFRESH = 15     # frames between overlay redraws
+PROFILE_DIR = Path("profiles")
+PROFILE_KEEP = 20        # newest session dumps kept
+
+
+def bucket_of(ns):
+    # log-spaced bucket index of a duration
+    if ns < 1000:
+        return 0
+    return min(int(math.log2(ns / 1000) * BUCKETS_PER_OCTAVE) + 1, BUCKETS - 1)
+
+
+def bucket_upper_us(index):
+    return 2 ** (index / BUCKETS_PER_OCTAVE)
+
+
+def percentile(values, p):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def histogram_percentile(counts, p):
+    # upper edge (us) of the bucket holding the p-th percentile
+    total = sum(counts)
+    if not total:
+        return 0.0
+    seen = 0
+    for index, count in enumerate(counts):
+        seen += count
+        if seen * 100 >= total * p:
+            return bucket_upper_us(index)
+    return bucket_upper_us(len(counts) - 1)
+
+
+class FrameProfiler:
+    # Times the phases of the main loop with perf_counter_ns. The loop calls
+    # start() once per frame and mark(phase) at the end of each phase; a
+    # phase is the time since the previous mark (or start), summed when it
+    # is marked more than once in a frame. "frame" is the time between two
+    # start() calls, so it includes the clock.tick() wait and shows dropped
+    # frames. The last HISTORY frames feed the overlay, every sample goes
+    # into a per-phase log histogram for dump().
+    def __init__(self, phases, history=HISTORY):
+        self.phases = ["frame"] + list(phases)
+        self.recent = {p: deque(maxlen=history) for p in self.phases}
+        self.histograms = {p: [0] * BUCKETS for p in self.phases}
+        self.started = time.time()
+        self.frame_start = None
+        self.last = None
+        self.current = {}
+        self.visible = False
+        self.overlay = None
+        self.overlay_age = 0
+
+    def start(self):
+        now = time.perf_counter_ns()
+        if self.frame_start is not None:
+            self.current["frame"] = now - self.frame_start
+            for phase, ns in self.current.items():
+                self.recent[phase].append(ns)
+                self.histograms[phase][bucket_of(ns)] += 1
+            self.current = {}
+        self.frame_start = self.last = now
+
+    def mark(self, phase):
+        now = time.perf_counter_ns()
+        self.current[phase] = self.current.get(phase, 0) + now - self.last
+        self.last = now
+
+    def summary(self, phase):
+        # (p50, p99) in ms over the recent frames
+        values = self.recent[phase]
+        return percentile(values, 50) / 1e6, percentile(values, 99) / 1e6
+
+    # --- Overlay ---
+    def toggle(self):
+        self.visible = not self.visible
+        self.overlay = None
+
+    def draw(self, screen, text, pos):
+        # Frame time graph (budget line in red) and p50/p99 per phase. Only
+        # rebuilt every OVERLAY_REFRESH frames so it costs next to nothing.
+        if not self.visible:
+            return
+        self.overlay_age += 1
+        if self.overlay is None or self.overlay_age >= OVERLAY_REFRESH:
+            self.overlay = self._render(text)
+            self.overlay_age = 0
+        screen.blit(self.overlay, pos)
+
+    def _render(self, text):
+        import pygame
+        width, height = OVERLAY_SIZE
+        surf = pygame.Surface(OVERLAY_SIZE, pygame.SRCALPHA)
+        surf.fill((0, 0, 0, 180))
+        graph_h = 40
+        scale = graph_h / (2 * FRAME_BUDGET_MS)   # graph tops out at two frames
+        frames = list(self.recent["frame"])[-width:]
+        for x, ns in enumerate(frames):
+            h = min(graph_h, int(ns / 1e6 * scale))
+            color = (255, 100, 100) if ns / 1e6 > FRAME_BUDGET_MS * 1.5 else (100, 255, 100)
+            pygame.draw.line(surf, color, (x, graph_h), (x, graph_h - h))
+        budget_y = graph_h - int(FRAME_BUDGET_MS * scale)
+        pygame.draw.line(surf, (255, 0, 0), (0, budget_y), (width, budget_y))
+        y = graph_h + 4
+        for phase in self.phases:
+            if not self.recent[phase]:
+                continue
+            p50, p99 = self.summary(phase)
+            line = f"{phase:<7} {p50:6.2f} {p99:6.2f} ms"
+            surf.blit(text.fonts["fps"].render(line, True, (220, 220, 220)), (4, y))
+            y += 13
+        return surf
+
+    # --- Session dump ---
+    def report(self):
+        phases = {}
+        for phase in self.phases:
+            counts = self.histograms[phase]
+            total = sum(counts)
+            if not total:
+                continue
+            last = max(i for i, c in enumerate(counts) if c)
+            phases[phase] = {
+                "count": total,
+                "p50_us": round(histogram_percentile(counts, 50), 1),
+                "p90_us": round(histogram_percentile(counts, 90), 1),
+                "p99_us": round(histogram_percentile(counts, 99), 1),
+                "max_us": round(bucket_upper_us(last), 1),
+                "counts": counts[:last + 1],
+            }
+        slow = sum(c for i, c in enumerate(self.histograms["frame"])
+                   if bucket_upper_us(i) > FRAME_BUDGET_MS * 1500)
+        return {"started": self.started, "seconds": round(time.time() - self.started, 1),
+                "buckets_per_octave": BUCKETS_PER_OCTAVE, "slow_frames": slow, "phases": phases}
+
+    def dump(self, folder=PROFILE_DIR):
+        # One JSON file per session, only the newest PROFILE_KEEP are kept.
+        if not any(self.histograms["frame"]):
+            return None
+        folder = Path(folder)
+        try:
+            folder.mkdir(parents=True, exist_ok=True)
+            path = folder / time.strftime("session-%Y%m%d-%H%M%S.json", time.localtime(self.started))
+            path.write_text(json.dumps(self.report(), indent=1), encoding="utf-8")
+            for old in sorted(folder.glob("session-*.json"))[:-PROFILE_KEEP]:
+                old.unlink()
+        except OSError as e:
+            print("Warning: could not save profile:", e)
+            return None
+        return path
+
+
+def describe(report):
+    lines = [f"  {report['seconds']:.0f} s, {report['slow_frames']} frames over 1.5x the budget"]
+    for phase, stats in report["phases"].items():
+        lines.append(f"  {phase:8s} n {stats['count']:7d}  p50 {stats['p50_us']:8.1f} us  "
+                     f"p90 {stats['p90_us']:8.1f} us  p99 {stats['p99_us']:8.1f} us  max {stats['max_us']:9.1f} us")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize frame profiles saved by the game.")
+    parser.add_argument("files", nargs="*", help="session dumps (default: the newest in profiles/)")
+    args = parser.parse_args(argv)
+    files = [Path(f) for f in args.files] or sorted(PROFILE_DIR.glob("session-*.json"))[-1:]
+    if not files:
+        print(f"No profiles in {PROFILE_DIR}/")
+        return 1
+    for path in files:
+        print(f"--- {path} ---")
+        print(describe(json.loads(path.read_text(encoding="utf-8"))))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+import argparse
+import json
+import math
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from charting import write_chart, LONG_NOTE_THRESHOLD
+from levelindex import find_audio
+
+
+# --- Config ---
+SUBDIVISION = 4          # grid steps per beat, 4 = sixteenth notes
+MIN_BPM, MAX_BPM = 60, 200
+PRIOR_BPM = 120          # tempo guesses are weighted towards this
+PRIOR_OCTAVES = 1.0      # width of that weighting, in doublings
+ENVELOPE_MS = 10         # resolution of the note onset envelope
+NOTE_BLUR_MS = 20        # each note is a gaussian this wide in the envelope
+MIN_NOTE_FIT = 0.5       # weakest grid fit (see note_fit) written when only the notes gave the tempo
+
+
+# --- Onset envelopes ---
+# Tempo is found the same way from either source: an onset strength curve
+# sampled every res_ms, from note times or from the audio's spectral flux.
+def envelope_from_notes(times, res_ms=ENVELOPE_MS):
+    times = np.asarray(times, np.float64)
+    env = np.zeros(int(times.max() / res_ms) + 64 if len(times) else 1)
+    np.add.at(env, (times / res_ms).round().astype(np.int64), 1.0)
+    width = NOTE_BLUR_MS / res_ms
+    x = np.arange(-int(3 * width), int(3 * width) + 1)
+    return np.convolve(env, np.exp(-0.5 * (x / width) ** 2), mode="same"), res_ms
+
+
+def envelope_from_audio(audio_path):
+    import autochart
+    samples, rate = autochart.resample(*autochart.decode(audio_path))
+    flux = autochart.spectral_features(samples, rate)[0]
+    # flux of frame i belongs to the frame centre, shift it there
+    res_ms = autochart.HOP * 1000.0 / rate
+    shift = int(round(autochart.FRAME / 2 / autochart.HOP))
+    return np.concatenate([np.zeros(shift, np.float32), flux]), res_ms
+
+
+# --- Tempo and phase ---
+def prior(bpm):
+    # log-normal weighting so a half or double tempo only wins when clearly better
+    return np.exp(-0.5 * (np.log2(bpm / PRIOR_BPM) / PRIOR_OCTAVES) ** 2)
+
+
+def estimate_tempo(env, res_ms, min_bpm=MIN_BPM, max_bpm=MAX_BPM):
+    # Autocorrelation peak over the allowed beat periods, weighted by prior().
+    env = env - env.mean()
+    size = 1 << int(2 * len(env) - 1).bit_length()
+    spectrum = np.fft.rfft(env, size)
+    acf = np.fft.irfft(spectrum * np.conj(spectrum), size)[:len(env)]
+    lags = np.arange(int(60000 / max_bpm / res_ms), int(60000 / min_bpm / res_ms) + 1)
+    lags = lags[(lags > 0) & (lags < len(acf))]
+    if len(lags) == 0:
+        return None
+    best = int(np.argmax(acf[lags] * prior(60000 / (lags * res_ms))))
+    lag = float(lags[best])
+    # parabolic interpolation between neighbouring lags
+    if 0 < best < len(lags) - 1:
+        a, b, c = acf[lags[best] - 1], acf[lags[best]], acf[lags[best] + 1]
+        if a - 2 * b + c != 0:
+            lag += 0.5 * (a - c) / (a - 2 * b + c)
+    return 60000 / (lag * res_ms)
+
+
+def fit_grid(env, res_ms, bpm, subdivision, spread=0.02, candidates=201):
+    # Fine tempo and grid phase: the step period (beat / subdivision) near
+    # bpm, within +-spread, whose phasor sum over the envelope is strongest,
+    # and that sum's angle as the offset of the grid. Done on steps, not
+    # beats, because off-beat notes cancel out a beat-rate phasor. Without
+    # this a lag-resolution error in the autocorrelation drifts by hundreds
+    # of ms over a long song. Also returns how coherent the best sum is.
+    steps = 60000 / subdivision / (bpm * np.linspace(1 - spread, 1 + spread, candidates))
+    at = np.arange(len(env)) * res_ms
+    weights = env.astype(np.float64)
+    sums = np.empty(candidates, np.complex128)
+    for start in range(0, candidates, 32):
+        chunk = steps[start:start + 32, None]
+        sums[start:start + 32] = (weights * np.exp(2j * np.pi * at / chunk)).sum(axis=1)
+    best = int(np.argmax(np.abs(sums)))
+    step = steps[best]
+    coherence = abs(sums[best]) / max(weights.sum(), 1e-12)
+    return 60000 / (step * subdivision), (np.angle(sums[best]) / (2 * np.pi) * step) % step, coherence
+
+
+def choose_grid(env, res_ms, subdivision, min_bpm=MIN_BPM, max_bpm=MAX_BPM):
+    # The autocorrelation cannot tell a tempo from 2/3 or 3/2 of it when the
+    # notes fill every eighth, so those are tried as well and the grid the
+    # notes sit on best wins. Half and double tempo grids nest inside each
+    # other and fit equally well, prior() picks between them.
+    # Returns (bpm, offset_ms) or None.
+    bpm = estimate_tempo(env, res_ms, min_bpm, max_bpm)
+    if bpm is None:
+        return None
+    fits = [fit_grid(env, res_ms, bpm * ratio, subdivision)
+            for ratio in (1, 3 / 2, 2 / 3, 4 / 3, 3 / 4) if min_bpm <= bpm * ratio <= max_bpm]
+    bpm = max(fits, key=lambda fit: fit[2])[0]
+    octaves = [bpm * ratio for ratio in (1, 2, 1 / 2) if min_bpm <= bpm * ratio <= max_bpm]
+    bpm = max(octaves, key=prior)
+    return fit_grid(env, res_ms, bpm, subdivision)[:2]
+
+
+def note_fit(coherence, bpm, subdivision):
+    # fit_grid() coherence of a note envelope as a share of what a perfectly
+    # quantized chart reaches: the NOTE_BLUR_MS blur caps it below 1, the
+    # more so the finer the grid. A wrong tempo guess scores well under half.
+    step = 60000 / bpm / subdivision
+    return coherence / np.exp(-2 * (np.pi * NOTE_BLUR_MS / step) ** 2)
+
+
+def refine_grid(times, bpm, offset_ms, subdivision):
+    # Least squares fit of note time = offset + k * step on the notes' nearest
+    # grid steps, so a slightly-off tempo does not drift over a long song.
+    times = np.asarray(times, np.float64)
+    step = 60000 / bpm / subdivision
+    for _ in range(3):
+        k = np.round((times - offset_ms) / step)
+        if len(np.unique(k)) < 2:
+            break
+        step, offset_ms = np.polyfit(k, times, 1)
+    return 60000 / (step * subdivision), offset_ms % step
+
+
+# --- Quantizing ---
+def snap(t, offset_ms, step):
+    # nearest grid step, but never one before 0 ms: an early onset near the
+    # song start goes to the first step at or after 0
+    k = max(round((t - offset_ms) / step), math.ceil(-offset_ms / step))
+    return int(round(offset_ms + k * step))
+
+
+def quantize_notes(notes, bpm, offset_ms, subdivision=SUBDIVISION, long_threshold=LONG_NOTE_THRESHOLD):
+    # Snaps note times and hold ends to the grid. Returns the new notes and
+    # one (note, shift_ms, end_shift_ms) per input note; notes that land on
+    # an already used time in their lane are dropped and reported with a
+    # None note. Holds are trimmed to end a step before the next note in
+    # their lane and fall back to taps when shorter than long_threshold.
+    step = 60000 / bpm / subdivision
+    snapped = []
+    moves = []
+    taken = set()
+    for n in sorted(notes, key=lambda n: (n["time"], n["side"])):
+        t = snap(n["time"], offset_ms, step)
+        end_shift = None
+        note = {"time": t, "side": n["side"]}
+        if n.get("duration", 0) > 0:
+            end = n["time"] + n["duration"]
+            snapped_end = max(snap(end, offset_ms, step), int(round(t + step)))
+            end_shift = snapped_end - end
+            note["duration"] = snapped_end - t
+        if (t, n["side"]) in taken:
+            moves.append((None, t - n["time"], end_shift))
+            continue
+        taken.add((t, n["side"]))
+        snapped.append(note)
+        moves.append((note, t - n["time"], end_shift))
+    next_in_lane = {}
+    for note in reversed(snapped):
+        if "duration" in note and note["side"] in next_in_lane:
+            room = next_in_lane[note["side"]] - note["time"] - int(round(step))
+            note["duration"] = min(note["duration"], room)
+        if "duration" in note and note["duration"] < long_threshold:
+            del note["duration"]
+        next_in_lane[note["side"]] = note["time"]
+    return snapped, moves
+
+
+def report(moves, bpm, offset_ms, subdivision, fit=None, verbose=False):
+    shifts = np.array([abs(m[1]) for m in moves] or [0])
+    ends = np.array([abs(m[2]) for m in moves if m[2] is not None] or [0])
+    dropped = sum(1 for m in moves if m[0] is None)
+    lines = [f"  grid: {bpm:.2f} BPM, {subdivision} steps per beat from {offset_ms:.1f} ms "
+             f"({60000 / bpm / subdivision:.1f} ms)" + (f", notes fit it {fit:.0%}" if fit is not None else ""),
+             f"  moved: mean {shifts.mean():.1f} ms, median {np.median(shifts):.1f} ms, "
+             f"p95 {np.percentile(shifts, 95):.1f} ms, max {shifts.max():.0f} ms",
+             f"  hold ends moved: mean {ends.mean():.1f} ms, max {ends.max():.0f} ms"]
+    if dropped:
+        lines.append(f"  {dropped} notes merged into a note already on that step")
+    if verbose:
+        for note, shift, end_shift in moves:
+            if note is None:
+                lines.append(f"    dropped (moved {shift:+.0f} ms onto a taken step)")
+            elif shift or end_shift:
+                line = f"    lane {note['side']} {note['time'] - shift:7.0f} -> {note['time']:7d} ({shift:+.0f} ms)"
+                if end_shift:
+                    line += f", hold end {end_shift:+.0f} ms"
+                lines.append(line)
+    return "\n".join(lines)
+
+
+def quantize_folder(folder, subdivision=SUBDIVISION, source="auto", bpm=None, offset_ms=None,
+                    dry_run=False, verbose=False):
+    folder = Path(folder)
+    meta_path = folder / "level.json"
+    meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    chart_path = folder / "chart.json"
+    notes = json.loads(chart_path.read_text(encoding="utf-8")).get("notes", [])
+    if not notes:
+        return f"{folder}: empty chart, nothing to quantize"
+    times = [n["time"] for n in notes]
+    estimated = bpm is None
+    fit = None
+    if bpm is None or offset_ms is None:
+        audio = find_audio(folder, meta) if source != "notes" else None
+        if audio is not None:
+            env, res_ms = envelope_from_audio(audio)
+        elif source == "audio":
+            return f"{folder}: no audio to estimate the tempo from"
+        else:
+            env, res_ms = envelope_from_notes(times)
+        if bpm is None:
+            grid = choose_grid(env, res_ms, subdivision)
+            if grid is None:
+                return f"{folder}: could not estimate a tempo"
+            bpm, offset = refine_grid(times, *grid, subdivision)
+        else:
+            offset = fit_grid(env, res_ms, bpm, subdivision, spread=0, candidates=1)[1]
+        if offset_ms is None:
+            offset_ms = offset
+        if audio is None:
+            fit = note_fit(fit_grid(env, res_ms, bpm, subdivision, spread=0, candidates=1)[2], bpm, subdivision)
+    snapped, moves = quantize_notes(notes, bpm, offset_ms, subdivision)
+    summary = f"{folder}: {len(notes)} notes -> {len(snapped)}\n" + report(moves, bpm, offset_ms, subdivision, fit, verbose)
+    if estimated and fit is not None and fit < MIN_NOTE_FIT:
+        # notes alone are easily fooled by a 2/3 or 3/4 tempo, and snapping
+        # to a wrong grid wrecks the chart
+        return summary + f"\n  grid fit under {MIN_NOTE_FIT:.0%}, not written; pass --bpm to quantize anyway"
+    if not dry_run:
+        write_chart(chart_path, snapped)
+        # the grid is kept with the level for tools that chart on beats
+        meta["grid"] = {"bpm": round(bpm, 3), "offset_ms": round(offset_ms, 1), "subdivision": subdivision}
+        meta_path.write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estimate a level's beat grid and snap its chart to it.")
+    parser.add_argument("folders", nargs="+", help="song folders (with level.json and chart.json)")
+    parser.add_argument("--subdivision", type=int, default=SUBDIVISION, help="grid steps per beat")
+    parser.add_argument("--source", choices=("auto", "audio", "notes"), default="auto",
+                        help="estimate the tempo from the audio or the chart's notes (auto: audio when there is some)")
+    parser.add_argument("--bpm", type=float, help="use this tempo instead of estimating it")
+    parser.add_argument("--offset", type=float, help="ms of the first beat, with --bpm")
+    parser.add_argument("--dry-run", action="store_true", help="report only, write nothing")
+    parser.add_argument("--verbose", action="store_true", help="list every moved note")
+    args = parser.parse_args(argv)
+    failed = 0
+    for folder in args.folders:
+        try:
+            print(quantize_folder(folder, args.subdivision, args.source, args.bpm, args.offset,
+                                  args.dry_run, args.verbose))
+        except (OSError, ValueError) as e:
+            print(f"{folder}: {e}")
+            failed += 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+import pygame
+
+
+# --- Config ---
+BACKGROUND = (0, 0, 0)   # play field colour, also the atlas colour key
+ZONE_BORDER = 3
+
+
+class Renderer:
+    # Draws the play field from engine state. Nothing here changes gameplay:
+    # note positions come straight from the song time being drawn.
+    #   hit_zones   top-left corner of each lane's hit zone square
+    #   speed       pixels per ms of scrolling at speed 1 (see scroll.py)
+    #   judgments   optional {message: Surface} for draw_judgment()
+    # Every sprite (a head per lane colour, the hold body, idle and pressed
+    # hit zones, judgments) is pre-rendered into one colour-keyed atlas and a
+    # frame is a single Surface.blits() call from it. Only what changed goes
+    # to the display: last frame's sprites are erased, this frame's drawn,
+    # and display.update() gets those rects plus the static HUD areas.
+    # Per frame: begin_frame(), draw_*(), flush() (anything drawn on the
+    # screen after it lands on top), end_frame().
+    def __init__(self, screen, hit_zones, square_size, speed, lane_colors, tail_color, zone_color,
+                 judgments=None, background=BACKGROUND):
+        self.screen = screen
+        self.hit_zones = hit_zones
+        self.square_size = square_size
+        self.speed = speed
+        self.lane_colors = lane_colors
+        self.tail_color = tail_color
+        self.zone_color = zone_color
+        self.background = background
+        self.height = screen.get_height()
+        self.static = []       # HUD areas the caller redraws every frame
+        self.batch = []
+        self.drawn = []
+        self.last = []         # rects drawn last frame, erased by the next one
+        self.full = True       # next frame clears and flips the whole screen
+        # erasing is one more blits() call, from a blank copy of the field
+        self.blank = pygame.Surface(screen.get_size())
+        self.blank.fill(background)
+        if pygame.display.get_surface() is not None:
+            self.blank = self.blank.convert()
+        self._build_atlas(judgments or {})
+
+    def _build_atlas(self, judgments):
+        # One row: a head per distinct lane colour, idle and pressed zone,
+        # the hold body (screen tall, so any visible tail is one sub-rect of
+        # it), then the judgment graphics.
+        size = self.square_size
+        colors = list(dict.fromkeys(self.lane_colors))
+        sprites = [(("head", color), (size, size)) for color in colors]
+        sprites += [("zone", (size, size)), ("zone_down", (size, size)),
+                    ("tail", (max(size // 2, 1), self.height))]
+        sprites += [(("judgment", msg), surf.get_size()) for msg, surf in judgments.items()]
+        self.rects = {}
+        x = 0
+        for key, (w, h) in sprites:
+            self.rects[key] = pygame.Rect(x, 0, w, h)
+            x += w
+        atlas = pygame.Surface((x, max(h for _, (_, h) in sprites)))
+        atlas.fill(self.background)
+        for color in colors:
+            atlas.fill(color, self.rects[("head", color)])
+        pygame.draw.rect(atlas, self.zone_color, self.rects["zone"], ZONE_BORDER)
+        pressed = self.rects["zone_down"]
+        atlas.fill([c // 3 for c in self.zone_color], pressed)
+        pygame.draw.rect(atlas, self.zone_color, pressed, ZONE_BORDER)
+        atlas.fill(self.tail_color, self.rects["tail"])
+        for msg, surf in judgments.items():
+            atlas.blit(surf, self.rects[("judgment", msg)])
+        if pygame.display.get_surface() is not None:
+            atlas = atlas.convert()
+        # background pixels are see-through, antialiased text edges already
+        # fade to the background colour
+        atlas.set_colorkey(self.background, pygame.RLEACCEL)
+        self.atlas = atlas
+
+    def add_static(self, rect):
+        # An area the caller draws into every frame (score, FPS...): cleared
+        # by begin_frame() and always sent by end_frame().
+        self.static.append(pygame.Rect(rect))
+
+    def remove_static(self, rect):
+        # The area stops being redrawn, repaint once to clear what was there.
+        self.static.remove(pygame.Rect(rect))
+        self.invalidate()
+
+    def invalidate(self):
+        # Something else drew on the screen (the menu), repaint all of it.
+        self.full = True
+        self.last = []
+
+    def begin_frame(self):
+        if self.full:
+            self.screen.blit(self.blank, (0, 0))
+        else:
+            blank = self.blank
+            self.screen.blits([(blank, rect, rect) for rect in self.last + self.static], False)
+        self.batch = []
+        self.drawn = []
+
+    def draw_hit_zones(self, down=None):
+        # down: per lane held state, held lanes get the pressed zone
+        atlas = self.atlas
+        idle = self.rects["zone"]
+        pressed = self.rects["zone_down"]
+        for lane, pos in enumerate(self.hit_zones):
+            self.batch.append((atlas, pos, pressed if down and down[lane] else idle))
+
+    def draw_notes(self, notes, song_time, scroll):
+        # scroll is the engine's ScrollTable: one lookup per frame, then every
+        # note is placed by its distance along the field from the hit zone.
+        size = self.square_size
+        speed = self.speed
+        height = self.height
+        atlas = self.atlas
+        rects = self.rects
+        tail = rects["tail"]
+        batch = self.batch
+        position = scroll.position(song_time)
+        for sq in notes:
+            # head top reaches the middle of the hit zone at note_time
+            x, zone_y = self.hit_zones[sq.side]
+            sq_y = int(zone_y + size // 2 - (sq.pos - position) * speed)
+
+            # If this is a long note, the tail extends upward from the head,
+            # clipped to the screen so it is one sub-rect of the atlas body
+            if sq.duration > 0:
+                top = max(sq_y - int((sq.end_pos - sq.pos) * speed), 0)
+                bottom = min(sq_y, height)
+                if bottom > top:
+                    batch.append((atlas, (x + size // 4, top), (tail.x, 0, tail.width, bottom - top)))
+            if -size < sq_y < height:
+                batch.append((atlas, (x, sq_y), rects[("head", self.lane_colors[sq.side])]))
+
+    def draw_judgment(self, msg, pos):
+        area = self.rects.get(("judgment", msg))
+        if area is not None:
+            self.batch.append((self.atlas, pos, area))
+
+    def flush(self):
+        # The whole batch in one blits() call, keeping the dirty rects.
+        if self.batch:
+            self.drawn += self.screen.blits(self.batch)
+            self.batch = []
+
+    def end_frame(self):
+        self.flush()
+        if self.full:
+            pygame.display.flip()
+            self.full = False
+        else:
+            pygame.display.update(self.last + self.drawn + self.static)
+        self.last = self.drawn
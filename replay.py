@@ -0,0 +1,166 @@
+import argparse
+import glob
+import hashlib
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import chartbin
+from engine import Engine
+from judgment import Judge
+
+
+# --- Config ---
+REPLAY_VERSION = 1
+REPLAYS_DIR = Path("replays")
+SONGS_DIR = Path("songs")
+SCORE_TOLERANCE = 1e-6   # hold points are float sums, allow for summation order
+
+
+# --- Replay format ---
+# A replay is everything the engine needs to reproduce a play exactly:
+#   level      song folder name, chart_hash guards against edited charts
+#   engine     lanes / travel_time_ms / linger_ms / judgment windows used
+#   inputs     [t, lane, down] in song ms, in the order they were applied
+#   result     score and judgment counts the game got, for regression checks
+def chart_hash(chart):
+    # Charts with scroll speed changes hash them too, they move spawn times.
+    if isinstance(chart, chartbin.Chart):
+        chart = {"notes": chart.to_notes(), "speeds": chart.speeds} if chart.speeds else chart.to_notes()
+    return hashlib.sha1(json.dumps(chart, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def make_replay(level_name, chart, engine):
+    return {
+        "version": REPLAY_VERSION,
+        "level": level_name,
+        "chart_hash": chart_hash(chart),
+        "engine": {
+            "lanes": engine.lane_count,
+            "travel_time_ms": engine.travel_time_ms,
+            "linger_ms": engine.linger_ms,
+            "speed": engine.speed,
+            "windows": engine.judge.windows,
+        },
+        "inputs": [[t, lane, down] for t, lane, down in engine.inputs],
+        "result": {"score": engine.score, "counts": engine.counts},
+    }
+
+
+def save_replay(replay, folder=REPLAYS_DIR):
+    folder = Path(folder)
+    folder.mkdir(exist_ok=True)
+    path = folder / f"{replay['level']}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    path.write_text(json.dumps(replay, separators=(",", ":")), encoding="utf-8")
+    return path
+
+
+def load_replay(path):
+    replay = json.loads(Path(path).read_text(encoding="utf-8"))
+    if replay.get("version") != REPLAY_VERSION:
+        raise ValueError(f"unsupported replay version {replay.get('version')}")
+    return replay
+
+
+# --- Headless simulation ---
+def simulate(replay, chart, frame_ms=None):
+    # Feeds the recorded inputs into a fresh engine on a fake clock. With
+    # frame_ms the clock also ticks update() like a game loop at that frame
+    # time; the result must not depend on it.
+    cfg = replay["engine"]
+    engine = Engine(cfg["lanes"], cfg["travel_time_ms"], cfg["linger_ms"], cfg.get("speed", 1.0))
+    engine.load(chart, Judge(cfg["windows"]))
+    inputs = replay["inputs"]
+    end = engine.finish_time()
+    if inputs:
+        end = max(end, inputs[-1][0] + 1)
+    i = 0
+    now = 0.0
+    while True:
+        now = now + frame_ms if frame_ms else end
+        while i < len(inputs) and inputs[i][0] <= now:
+            t, lane, down = inputs[i]
+            if down:
+                engine.press(lane, t)
+            else:
+                engine.release(lane, t)
+            i += 1
+        engine.update(now)
+        if now >= end:
+            return engine
+
+
+def check(replay, engine):
+    expected = replay.get("result")
+    if expected is None:
+        return True
+    return abs(engine.score - expected["score"]) <= SCORE_TOLERANCE and engine.counts == expected["counts"]
+
+
+def run_one(args):
+    path, songs_dir, frame_ms = args
+    replay = load_replay(path)
+    chart = chartbin.load(Path(songs_dir) / replay["level"])
+    if chart_hash(chart) != replay["chart_hash"]:
+        return path, None, False, "chart changed"
+    engine = simulate(replay, chart, frame_ms)
+    return path, engine.score, check(replay, engine), ""
+
+
+def run_batch(paths, songs_dir, frame_ms, repeat):
+    # Same replay many times in one process, for engine throughput.
+    charts = {}
+    loaded = []
+    for path in paths:
+        replay = load_replay(path)
+        if replay["level"] not in charts:
+            charts[replay["level"]] = chartbin.load(Path(songs_dir) / replay["level"])
+        loaded.append((replay, charts[replay["level"]]))
+    failures = 0
+    for _ in range(repeat):
+        for replay, chart in loaded:
+            if not check(replay, simulate(replay, chart, frame_ms)):
+                failures += 1
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-simulate rhythm game replays without a display.")
+    parser.add_argument("replays", nargs="*", help="replay files (default: replays/*.json)")
+    parser.add_argument("--songs", default=str(SONGS_DIR), help="songs folder the replays refer to")
+    parser.add_argument("--frame-ms", type=float, default=None,
+                        help="also tick the engine at this frame time (default: only at inputs)")
+    parser.add_argument("--repeat", type=int, default=1, help="simulate every replay N times")
+    parser.add_argument("--jobs", type=int, default=1, help="worker processes")
+    args = parser.parse_args(argv)
+
+    paths = args.replays or sorted(glob.glob(str(REPLAYS_DIR / "*.json")))
+    if not paths:
+        print("No replays found.")
+        return 1
+
+    failed = 0
+    for path, score, ok, why in map(run_one, [(p, args.songs, args.frame_ms) for p in paths]):
+        status = "ok" if ok else f"MISMATCH {why}".strip()
+        print(f"{path}: score {score if score is None else int(score)} {status}")
+        failed += not ok
+
+    start = time.perf_counter()
+    if args.jobs > 1:
+        with ProcessPoolExecutor(args.jobs) as pool:
+            per_job = [max(1, args.repeat // args.jobs)] * args.jobs
+            failed_runs = sum(pool.map(run_batch, [paths] * args.jobs, [args.songs] * args.jobs,
+                                       [args.frame_ms] * args.jobs, per_job))
+        runs = sum(per_job) * len(paths)
+    else:
+        failed_runs = run_batch(paths, args.songs, args.frame_ms, args.repeat)
+        runs = args.repeat * len(paths)
+    elapsed = time.perf_counter() - start
+    print(f"{runs} simulations in {elapsed:.3f}s ({runs / elapsed:.0f} replays/s), {failed_runs} mismatched")
+    return 1 if failed or failed_runs else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+import argparse
+import json
+import queue
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from pathlib import Path
+from types import SimpleNamespace
+
+from replay import make_replay, REPLAYS_DIR
+
+
+# --- Config ---
+DB_PATH = Path("scores.db")
+SCHEMA_VERSION = 1
+BATCH_MS = 500     # the writer commits what arrived within this long in one transaction
+TOP_N = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS plays (
+    id INTEGER PRIMARY KEY,
+    level TEXT NOT NULL,
+    chart_hash TEXT NOT NULL,
+    player TEXT NOT NULL,
+    played_at REAL NOT NULL,
+    score REAL NOT NULL,
+    possible REAL NOT NULL,
+    accuracy REAL NOT NULL,
+    speed REAL NOT NULL,
+    counts TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS plays_top ON plays (level, score DESC);
+CREATE INDEX IF NOT EXISTS plays_best ON plays (level, player, score DESC);
+CREATE TABLE IF NOT EXISTS judgments (
+    play_id INTEGER NOT NULL REFERENCES plays(id),
+    note_time INTEGER NOT NULL,
+    lane INTEGER NOT NULL,
+    offset_ms REAL,
+    judgment TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS judgments_play ON judgments (play_id);
+CREATE TABLE IF NOT EXISTS replays (
+    play_id INTEGER PRIMARY KEY REFERENCES plays(id),
+    data BLOB NOT NULL
+);
+"""
+
+
+def connect(path=DB_PATH):
+    db = sqlite3.connect(str(path))
+    # WAL: the writer thread never blocks menu reads, NORMAL sync is still
+    # safe against corruption and only syncs on checkpoints
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(SCHEMA)
+    db.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+    return db
+
+
+def snapshot(engine):
+    # What a play record needs from the engine, copied so the next level can
+    # reuse the engine while the writer is still busy.
+    return SimpleNamespace(
+        lane_count=engine.lane_count, travel_time_ms=engine.travel_time_ms, linger_ms=engine.linger_ms,
+        speed=engine.speed, judge=engine.judge, inputs=list(engine.inputs), score=engine.score,
+        counts=dict(engine.counts), judged=list(engine.judged), perfect_possible=engine.perfect_possible)
+
+
+def insert_play(db, level, chart, engine, player, played_at):
+    replay = make_replay(level, chart, engine)
+    accuracy = engine.score / engine.perfect_possible * 100.0 if engine.perfect_possible > 0 else 0.0
+    cur = db.execute(
+        "INSERT INTO plays (level, chart_hash, player, played_at, score, possible, accuracy, speed, counts) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (level, replay["chart_hash"], player, played_at, engine.score, engine.perfect_possible, accuracy,
+         engine.speed, json.dumps(engine.counts)))
+    play_id = cur.lastrowid
+    db.executemany("INSERT INTO judgments (play_id, note_time, lane, offset_ms, judgment) VALUES (?, ?, ?, ?, ?)",
+                   [(play_id, t, lane, offset, msg) for t, lane, offset, msg in engine.judged])
+    db.execute("INSERT INTO replays (play_id, data) VALUES (?, ?)",
+               (play_id, zlib.compress(json.dumps(replay, separators=(",", ":")).encode())))
+    return play_id
+
+
+class ScoreStore:
+    # Finished plays go into scores.db from a writer thread: record() only
+    # queues a snapshot, the thread hashes the chart, builds the replay and
+    # commits everything that arrived within BATCH_MS in one transaction.
+    # top() and best() read through the indexes on a second connection and
+    # are cached per level until a new play for that level is committed, so
+    # the menu can ask every frame.
+    def __init__(self, path=DB_PATH, player="player"):
+        self.path = Path(path)
+        self.player = player
+        self.queue = queue.Queue()
+        self.cache = {}
+        self.generation = {}     # level -> commits so far, stale query results are dropped
+        self.cache_lock = threading.Lock()
+        self.db = None
+        try:
+            self.db = connect(self.path)
+        except sqlite3.Error as e:
+            print("Warning: score store unavailable:", e)
+            return
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+
+    def record(self, level, chart, engine):
+        if self.db is None:
+            return
+        self.queue.put((level, chart, snapshot(engine), self.player, time.time()))
+
+    def top(self, level, n=TOP_N):
+        # [(player, score, accuracy), ...] best first
+        return self._cached(("top", level, n), "SELECT player, score, accuracy FROM plays WHERE level = ? "
+                            "ORDER BY score DESC LIMIT ?", (level, n))
+
+    def best(self, level, player=None):
+        # (score, accuracy) of the player's best play, or None
+        rows = self._cached(("best", level, player or self.player), "SELECT score, accuracy FROM plays "
+                            "WHERE level = ? AND player = ? ORDER BY score DESC LIMIT 1",
+                            (level, player or self.player))
+        return rows[0] if rows else None
+
+    def _cached(self, key, sql, args):
+        level = key[1]
+        with self.cache_lock:
+            rows = self.cache.get(key)
+            generation = self.generation.get(level, 0)
+        if rows is None:
+            rows = []
+            if self.db is not None:
+                try:
+                    rows = self.db.execute(sql, args).fetchall()
+                except sqlite3.Error as e:
+                    print("Warning: score query failed:", e)
+            with self.cache_lock:
+                # a commit for this level while the query ran may have been
+                # missed by it, so the rows are used once but not cached
+                if self.generation.get(level, 0) == generation:
+                    self.cache[key] = rows
+        return rows
+
+    def shutdown(self, timeout=5.0):
+        # Waits for queued plays to be written.
+        if self.db is None:
+            return
+        self.queue.put(None)
+        self.writer.join(timeout)
+        self.db.close()
+
+    def _write_loop(self):
+        db = connect(self.path)
+        running = True
+        while running:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + BATCH_MS / 1000.0
+            while batch[-1] is not None and time.monotonic() < deadline:
+                try:
+                    batch.append(self.queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            if batch[-1] is None:
+                running = False
+                batch.pop()
+            if not batch:
+                continue
+            try:
+                with db:
+                    for level, chart, engine, player, played_at in batch:
+                        insert_play(db, level, chart, engine, player, played_at)
+            except sqlite3.Error as e:
+                print("Warning: could not save scores:", e)
+                continue
+            levels = {item[0] for item in batch}
+            with self.cache_lock:
+                for level in levels:
+                    self.generation[level] = self.generation.get(level, 0) + 1
+                for key in list(self.cache):
+                    if key[1] in levels:
+                        del self.cache[key]
+        db.close()
+
+
+def export_replays(db, play_ids, folder=REPLAYS_DIR):
+    # Writes replay JSON files replay.py can re-simulate.
+    folder = Path(folder)
+    folder.mkdir(exist_ok=True)
+    paths = []
+    for play_id in play_ids:
+        row = db.execute("SELECT level, data FROM replays JOIN plays ON plays.id = play_id WHERE play_id = ?",
+                         (play_id,)).fetchone()
+        if row is None:
+            print(f"No replay for play {play_id}")
+            continue
+        path = folder / f"{row[0]}-play{play_id}.json"
+        path.write_bytes(zlib.decompress(row[1]))
+        paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show the score store and export replays from it.")
+    parser.add_argument("levels", nargs="*", help="levels to list (default: every level)")
+    parser.add_argument("--db", default=str(DB_PATH), help="score database")
+    parser.add_argument("--top", type=int, default=TOP_N, help="plays listed per level")
+    parser.add_argument("--export", type=int, nargs="+", metavar="PLAY", help="write these plays' replays")
+    parser.add_argument("--out", default=str(REPLAYS_DIR), help="folder for exported replays")
+    args = parser.parse_args(argv)
+    if not Path(args.db).exists():
+        print(f"No score store at {args.db}")
+        return 1
+    db = connect(args.db)
+    if args.export:
+        for path in export_replays(db, args.export, args.out):
+            print(f"Wrote {path}")
+        return 0
+    levels = args.levels or [row[0] for row in db.execute("SELECT DISTINCT level FROM plays ORDER BY level")]
+    for level in levels:
+        print(f"--- {level} ---")
+        rows = db.execute("SELECT id, player, score, accuracy, played_at, counts FROM plays WHERE level = ? "
+                          "ORDER BY score DESC LIMIT ?", (level, args.top))
+        for rank, (play_id, player, score, accuracy, played_at, counts) in enumerate(rows, 1):
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(played_at))
+            counts = ", ".join(f"{k} {v}" for k, v in json.loads(counts).items())
+            print(f"  {rank}. {score:8.0f} {accuracy:6.2f}%  {player:12s} {when}  (play {play_id}: {counts})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+from bisect import bisect_left, bisect_right
+
+
+# --- Config ---
+MIN_MULTIPLIER, MAX_MULTIPLIER = 0.25, 4.0   # player scroll speed range
+MULTIPLIER_STEP = 0.25
+
+
+class ScrollTable:
+    # Piecewise-linear position of the play field over song time, for charts
+    # with scroll speed changes. Positions are in "base ms": how far the field
+    # has moved, measured in ms of scrolling at speed 1, so with no changes and
+    # multiplier 1 position(t) == t and screen y is position * pixels-per-ms.
+    #   segments    [(time_ms, speed), ...] from the chart; speed applies from
+    #               time_ms to the next change, 1.0 before the first one.
+    #               0 stops the field until the next change (a stop with no
+    #               later change is ignored), negative speeds count as 0.
+    #   multiplier  the player's scroll speed setting, scales every segment
+    # The table holds one (time, position, speed) row per change, so position()
+    # and time_at() are a bisect plus one multiply-add.
+    def __init__(self, segments=(), multiplier=1.0):
+        self.multiplier = multiplier
+        self.times = [0.0]
+        self.positions = [0.0]
+        self.speeds = [multiplier]
+        for time_ms, speed in sorted(segments):
+            time_ms = max(float(time_ms), 0.0)
+            speed = max(float(speed), 0.0) * multiplier
+            if time_ms == self.times[-1]:
+                self.speeds[-1] = speed
+                continue
+            self.positions.append(self.positions[-1] + (time_ms - self.times[-1]) * self.speeds[-1])
+            self.times.append(time_ms)
+            self.speeds.append(speed)
+        while len(self.times) > 1 and self.speeds[-1] == 0:
+            for column in (self.times, self.positions, self.speeds):
+                column.pop()
+        if self.speeds[-1] == 0:
+            self.speeds[-1] = multiplier
+
+    def position(self, t):
+        if t < 0:
+            # before the song the field moves at the player's speed
+            return t * self.multiplier
+        k = bisect_right(self.times, t) - 1
+        return self.positions[k] + (t - self.times[k]) * self.speeds[k]
+
+    def time_at(self, p):
+        # Earliest song time the field reaches position p. Positions never
+        # decrease, so a stop maps to the moment it starts.
+        if p < 0:
+            return p / self.multiplier if self.multiplier > 0 else 0.0
+        k = bisect_left(self.positions, p) - 1
+        if k < 0:
+            return self.times[0]
+        return self.times[k] + (p - self.positions[k]) / self.speeds[k]
+
+    def positions_of(self, times):
+        # position() for a sorted list of times in one merge pass, O(n + segments).
+        out = []
+        k = 0
+        last = len(self.times) - 1
+        for t in times:
+            if t < 0:
+                out.append(t * self.multiplier)
+                continue
+            while k < last and self.times[k + 1] <= t:
+                k += 1
+            out.append(self.positions[k] + (t - self.times[k]) * self.speeds[k])
+        return out
+
+
+    def times_at(self, positions):
+        # time_at() for a sorted list of positions in one merge pass.
+        out = []
+        k = 0
+        last = len(self.times) - 1
+        for p in positions:
+            if p <= 0:
+                out.append(self.time_at(p))
+                continue
+            while k < last and self.positions[k + 1] < p:
+                k += 1
+            out.append(self.times[k] + (p - self.positions[k]) / self.speeds[k])
+        return out
+
+
+def clamp_multiplier(value):
+    return min(max(value, MIN_MULTIPLIER), MAX_MULTIPLIER)
@@ -0,0 +1,93 @@
+import json
+import time
+from pathlib import Path
+
+
+# --- Config ---
+CALIBRATION_FILE = Path("calibration.json")
+SMOOTHING = 0.1      # fraction of the audio/wall error corrected per new audio position
+RESYNC_MS = 120      # errors bigger than this (stall, seek) are snapped instead of smoothed
+OFFSET_STEP = 5      # ms per calibration key press
+
+
+def load_setting(name, default, path=CALIBRATION_FILE, kind=float):
+    # calibration.json holds this cabinet's settings: the A/V offset, the
+    # player's scroll speed and the like.
+    try:
+        return kind(json.loads(Path(path).read_text(encoding="utf-8")).get(name, default))
+    except (OSError, ValueError, AttributeError):
+        return default
+
+
+def save_setting(name, value, path=CALIBRATION_FILE):
+    try:
+        settings = json.loads(Path(path).read_text(encoding="utf-8"))
+        if not isinstance(settings, dict):
+            settings = {}
+    except (OSError, ValueError):
+        settings = {}
+    settings[name] = value
+    try:
+        Path(path).write_text(json.dumps(settings, indent=2), encoding="utf-8")
+    except OSError as e:
+        print("Warning: could not save calibration:", e)
+
+
+def load_offset(path=CALIBRATION_FILE):
+    return load_setting("audio_offset_ms", 0.0, path)
+
+
+def save_offset(offset_ms, path=CALIBRATION_FILE):
+    save_setting("audio_offset_ms", offset_ms, path)
+
+
+class SongClock:
+    # Song time in ms that follows the real playback position.
+    # get_pos() (ms since play(), -1 when not playing) only advances in
+    # mixer-buffer sized steps, so the clock runs on perf_counter and is
+    # pulled towards each new audio position a little at a time. It never
+    # goes backwards, and keeps running on the wall clock when there is no
+    # audio (mixer failed, song ended).
+    # offset_ms is the per-cabinet calibration: positive when the sound
+    # reaches the player later than the picture.
+    def __init__(self, get_pos=None, offset_ms=0.0, wall=time.perf_counter):
+        self.get_pos = get_pos
+        self.offset_ms = offset_ms
+        self.wall = wall
+        self.base = 0.0          # wall ms that corresponds to song time 0
+        self.start_ms = 0.0      # song position play() was started at
+        self.last_pos = None
+        self.last_time = 0.0
+
+    def start(self, position_ms=0.0):
+        self.start_ms = position_ms
+        self.base = self.wall() * 1000.0 - position_ms
+        self.last_pos = None
+        self.last_time = position_ms - self.offset_ms
+
+    def time(self):
+        now = self.wall() * 1000.0
+        estimate = now - self.base
+        pos = self._audio_pos()
+        if pos is not None and pos != self.last_pos:
+            self.last_pos = pos
+            error = (self.start_ms + pos) - estimate
+            if abs(error) > RESYNC_MS:
+                self.base -= error
+            else:
+                self.base -= error * SMOOTHING
+            estimate = now - self.base
+        song_time = estimate - self.offset_ms
+        if song_time < self.last_time:
+            song_time = self.last_time
+        self.last_time = song_time
+        return song_time
+
+    def _audio_pos(self):
+        if self.get_pos is None:
+            return None
+        try:
+            pos = self.get_pos()
+        except Exception:
+            return None
+        return pos if pos >= 0 else None
@@ -0,0 +1,210 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+from pathlib import Path
+
+from levelindex import AUDIO_EXTS
+
+
+# --- Config ---
+SETTLE_MS = 300      # a folder is reported once it has been quiet this long (copies in progress)
+POLL_S = 1.0         # fallback scan interval where inotify is unavailable
+WATCHED_FILES = ("level.json", "chart.json")   # plus audio files, see relevant()
+
+# inotify(7)
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+SONGS_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+FOLDER_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+EVENT = struct.Struct("iIII")   # wd, mask, cookie, len, then len bytes of name
+
+
+def relevant(name):
+    # Only what the level index reads; caches the game writes into a song
+    # folder (chart.bin, preview.png, .audio.wav) must not trigger a reload.
+    if name.startswith("."):
+        return False
+    return name in WATCHED_FILES or name.lower().endswith(AUDIO_EXTS)
+
+
+def load_inotify():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, "inotify_init1"):
+        return None
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return libc
+
+
+class SongWatcher:
+    # Reports song folders that changed on disk, so the menu can re-read just
+    # those (LevelIndex.update) instead of rescanning every installed song.
+    # A background thread follows inotify events on the songs folder and on
+    # every song folder in it; without inotify (not Linux, or out of
+    # watches) it falls back to scanning the folders' file stats every
+    # POLL_S. Either way nothing is read on the main thread: changed()
+    # returns the folder names that have been quiet for SETTLE_MS, so a song
+    # still being copied is picked up once, when it is complete.
+    def __init__(self, songs_dir, poll=False):
+        self.songs_dir = Path(songs_dir)
+        self.pending = {}        # folder name -> time of its last event
+        self.lock = threading.Lock()
+        self.running = True
+        self.fd = None
+        libc = None if poll else load_inotify()
+        if libc is not None:
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0:
+                self.libc = libc
+                self.fd = fd
+                self.watches = {}    # watch descriptor -> folder name, None for songs_dir
+            else:
+                print("Warning: inotify unavailable, polling song folders:", os.strerror(ctypes.get_errno()))
+        if self.fd is not None and not self._watch_all():
+            self._close_inotify()
+        self.mode = "inotify" if self.fd is not None else "poll"
+        if self.fd is not None:
+            target = self._inotify_loop
+        else:
+            self.snapshot = self._scan()
+            target = self._poll_loop
+        self.thread = threading.Thread(target=target, daemon=True)
+        self.thread.start()
+
+    def changed(self):
+        # Folder names to re-read, once each went quiet.
+        now = time.monotonic()
+        with self.lock:
+            ready = [name for name, t in self.pending.items() if now - t >= SETTLE_MS / 1000.0]
+            for name in ready:
+                del self.pending[name]
+        return ready
+
+    def stop(self):
+        self.running = False
+        self.thread.join(1.0)
+        self._close_inotify()
+
+    def _mark(self, name):
+        with self.lock:
+            self.pending[name] = time.monotonic()
+
+    # --- inotify ---
+    def _add_watch(self, path, mask):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            print("Warning: could not watch", path, os.strerror(ctypes.get_errno()))
+            return None
+        return wd
+
+    def _watch_all(self):
+        # songs_dir itself first, so a folder created meanwhile is not missed
+        self.songs_dir.mkdir(exist_ok=True)
+        wd = self._add_watch(self.songs_dir, SONGS_MASK)
+        if wd is None:
+            return False
+        self.watches = {wd: None}
+        for folder in self.songs_dir.iterdir():
+            if folder.is_dir() and not folder.name.startswith("."):
+                wd = self._add_watch(folder, FOLDER_MASK)
+                if wd is None:
+                    return False
+                self.watches[wd] = folder.name
+        return True
+
+    def _close_inotify(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def _inotify_loop(self):
+        while self.running:
+            try:
+                ready, _, _ = select.select([self.fd], [], [], 0.5)
+                if not ready:
+                    continue
+                data = os.read(self.fd, 65536)
+            except (OSError, ValueError, TypeError):
+                return    # closed by stop()
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT.unpack_from(data, offset)
+                name = data[offset + EVENT.size:offset + EVENT.size + length].split(b"\0", 1)[0]
+                offset += EVENT.size + length
+                self._handle(wd, mask, os.fsdecode(name))
+
+    def _handle(self, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            # events were lost: every folder is re-checked against the index
+            if not self._watch_all():
+                print("Warning: lost track of song folders, press R to rescan")
+            for folder in self.songs_dir.iterdir():
+                if folder.is_dir() and not folder.name.startswith("."):
+                    self._mark(folder.name)
+            return
+        if mask & IN_IGNORED:
+            self.watches.pop(wd, None)
+            return
+        if wd not in self.watches:
+            return
+        folder = self.watches[wd]
+        if folder is not None:
+            if relevant(name):
+                self._mark(folder)
+            return
+        # an event in songs_dir: a song folder came, went or was renamed
+        if not mask & IN_ISDIR or name.startswith("."):
+            return
+        if mask & (IN_CREATE | IN_MOVED_TO):
+            # files copied in before the watch was added are covered by the
+            # folder being re-read as a whole
+            new_wd = self._add_watch(self.songs_dir / name, FOLDER_MASK)
+            if new_wd is not None:
+                self.watches[new_wd] = name
+        elif mask & IN_MOVED_FROM:
+            for old, folder in list(self.watches.items()):
+                if folder == name:
+                    self.libc.inotify_rm_watch(self.fd, old)
+                    del self.watches[old]
+        self._mark(name)
+
+    # --- Polling fallback ---
+    def _scan(self):
+        # folder name -> stats of the files the index reads
+        snapshot = {}
+        try:
+            folders = [f for f in os.scandir(self.songs_dir) if f.is_dir() and not f.name.startswith(".")]
+        except OSError:
+            return snapshot
+        for folder in folders:
+            try:
+                files = [(f.name, f.stat().st_mtime_ns, f.stat().st_size)
+                         for f in os.scandir(folder.path) if relevant(f.name)]
+            except OSError:
+                files = None
+            snapshot[folder.name] = sorted(files) if files is not None else None
+        return snapshot
+
+    def _poll_loop(self):
+        while self.running:
+            time.sleep(POLL_S)
+            snapshot = self._scan()
+            for name in snapshot.keys() | self.snapshot.keys():
+                if snapshot.get(name, -1) != self.snapshot.get(name, -1):
+                    self._mark(name)
+            self.snapshot = snapshot
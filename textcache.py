@@ -0,0 +1,67 @@
+import pygame
+from collections import OrderedDict
+
+
+# --- Config ---
+# Every font the game uses, loaded once at startup (SysFont lookups are slow on the Pi).
+FONT_SIZES = {
+    "title": 48,
+    "big": 48,
+    "results": 44,
+    "judgment": 40,
+    "score": 36,
+    "small": 28,
+    "fps": 18,
+}
+CACHE_SIZE = 256  # rendered strings kept around
+DIGITS = "0123456789-+.%"
+
+
+class TextCache:
+    # Font registry + LRU of rendered text surfaces keyed by (font, text, color).
+    # Numbers that change every frame (score, FPS) are drawn from a per
+    # font/color glyph atlas instead, so they never rasterize anything.
+    def __init__(self, sizes=FONT_SIZES, max_items=CACHE_SIZE):
+        self.fonts = {name: pygame.font.SysFont(None, size) for name, size in sizes.items()}
+        self.max_items = max_items
+        self.surfaces = OrderedDict()
+        self.atlases = {}
+
+    def render(self, font, text, color):
+        key = (font, text, color)
+        surf = self.surfaces.get(key)
+        if surf is not None:
+            self.surfaces.move_to_end(key)
+            return surf
+        surf = self.fonts[font].render(text, True, color)
+        self.surfaces[key] = surf
+        if len(self.surfaces) > self.max_items:
+            self.surfaces.popitem(last=False)
+        return surf
+
+    def blit(self, screen, font, text, color, pos):
+        surf = self.render(font, text, color)
+        screen.blit(surf, pos)
+        return surf
+
+    def atlas(self, font, color):
+        key = (font, color)
+        glyphs = self.atlases.get(key)
+        if glyphs is None:
+            glyphs = {ch: self.fonts[font].render(ch, True, color) for ch in DIGITS}
+            self.atlases[key] = glyphs
+        return glyphs
+
+    def blit_number(self, screen, font, label, value, color, pos):
+        # Draws the cached `label` followed by `value` glyph by glyph.
+        x, y = pos
+        if label:
+            x += self.blit(screen, font, label, color, pos).get_width()
+        glyphs = self.atlas(font, color)
+        batch = []
+        for ch in str(value):
+            glyph = glyphs[ch]
+            batch.append((glyph, (x, y)))
+            x += glyph.get_width()
+        screen.blits(batch, False)
+        return x
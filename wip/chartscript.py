@@ -1,12 +1,19 @@
 import pygame
-import json
 import sys
+from pathlib import Path
+
+# shared charting helpers live next to the game
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from charting import NoteRecorder, EventPump, ChartJournal, recover_journal, apply_controls, LONG_NOTE_THRESHOLD
+from controls import Controls
+from hitsound import HitSounds, pre_init
+from layout import Layout
+from songclock import SongClock, load_offset
 
 # --- Config ---
 WIDTH, HEIGHT = 400, 300
-FPS = 60
 CIRCLE_RADIUS = 50
-LONG_NOTE_THRESHOLD = 250  # ms
+CHART_FILE = "chart.json"
 
 # Colors
 WHITE = (255, 255, 255)
@@ -18,26 +25,24 @@ GRAY = (150, 150, 150)
 
 
 # --- Initialize ---
+pre_init()   # small mixer buffer, the press clicks come back right away
 pygame.init()
 pygame.mixer.init()
+sounds = HitSounds()
 screen = pygame.display.set_mode((WIDTH, HEIGHT))
 pygame.display.set_caption("Rhythm Game Charter")
-clock = pygame.time.Clock()
+font = pygame.font.SysFont(None, 36)
 
 # --- Game Variables ---
-KEY_BINDINGS = {
-    0: pygame.K_z,
-    1: pygame.K_x,
-    2: pygame.K_UP,
-    3: pygame.K_DOWN,
-    4: pygame.K_LEFT,
-    5: pygame.K_RIGHT
-}
-
-key_pressed = {key: False for key in KEY_BINDINGS.values()}
-press_start_time = {key: None for key in KEY_BINDINGS.values()}
-notes = []  # collected notes
-song_start_time = None
+# Z, X, then the arrows (layout.py's 6 lane keys); the joystick directions
+# play the arrow lanes
+controls = Controls(Layout(6))
+# A journal left by a crashed session is saved into the chart first
+recovered = recover_journal(CHART_FILE)
+if recovered:
+    print(f"Recovered {recovered} notes from an unfinished session into {CHART_FILE}")
+journal = ChartJournal(CHART_FILE)
+recorder = NoteRecorder(LONG_NOTE_THRESHOLD, journal=journal)
 
 # Circles positions
 left_circle = (WIDTH // 4, HEIGHT // 2)
@@ -45,45 +50,23 @@ right_circle = (3 * WIDTH // 4, HEIGHT // 2)
 
 # --- Load song ---
 SONG_FILE = "Nhelv  Silentroom  駿    BOFU2017.mp3"  # Change to your song file
+song_clock = SongClock(pygame.mixer.music.get_pos, load_offset())
+pump = EventPump(song_clock)
 pygame.mixer.music.load(SONG_FILE)
 pygame.mixer.music.play()
-song_start_time = pygame.time.get_ticks()
+song_clock.start()
 
 # --- Main Loop ---
 running = True
 while running:
-    dt = clock.tick(FPS)
-    screen.fill(BLACK)
-
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-
-    # Current song time
-    song_time = pygame.time.get_ticks() - song_start_time
-
-    # Input handling
-    keys = pygame.key.get_pressed()
+    # Input is handled as it arrives, drawing happens at FPS
+    events, song_time, draw = pump.poll()
+    running = apply_controls(events, controls, recorder, song_time, sounds)
+    journal.maybe_sync()
+    if not draw:
+        continue
 
-    for side, key in KEY_BINDINGS.items():
-        if keys[key]:
-            if not key_pressed[key]:
-                key_pressed[key] = True
-                press_start_time[key] = song_time
-        else:
-            if key_pressed[key]:
-                key_pressed[key] = False
-                start_time = press_start_time[key]
-                duration = song_time - start_time if start_time is not None else 0
-
-                if duration >= LONG_NOTE_THRESHOLD:
-                    notes.append({"time": start_time, "side": side, "duration": duration})
-                    print(f"Recorded LONG note: start={start_time}, side={side}, duration={duration}")
-                else:
-                    notes.append({"time": start_time, "side": side})
-                    print(f"Recorded TAP note: time={start_time}, side={side}")
-
-                press_start_time[key] = None
+    screen.fill(BLACK)
 
 
         # Left (Z, X)
@@ -101,25 +84,19 @@ while running:
 
     # Draw
     for side, (x, y) in enumerate(positions):
-        key = KEY_BINDINGS[side]
-        if key_pressed[key]:
+        if recorder.is_down(side):
             pygame.draw.circle(screen, GRAY, (x, y), CIRCLE_RADIUS)
         pygame.draw.circle(screen, BLUE if side >= 2 else RED, (x, y), CIRCLE_RADIUS, 5)
 
 
     # Show current time
-    font = pygame.font.SysFont(None, 36)
-    text = font.render(f"Time: {song_time} ms", True, GREEN)
+    text = font.render(f"Time: {int(song_time)} ms", True, GREEN)
     screen.blit(text, (10, 10))
 
     pygame.display.flip()
 
-# --- Save chart (sorted by time) ---
-notes.sort(key=lambda n: n["time"])
-chart_data = {"notes": notes}
-with open("chart.json", "w") as f:
-    json.dump(chart_data, f, indent=4)
-
-print("Chart saved to chart.json")
+# --- Save chart (journal compacted into a sorted chart.json) ---
+notes = journal.close()
+print(f"Chart saved to {CHART_FILE} ({len(notes)} notes)")
 pygame.quit()
 sys.exit()